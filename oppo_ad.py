@@ -1,19 +1,62 @@
 #oppo广告相关脚本的选择器
+#三个脚本在同一个进程里运行，连接池、token在多次选择之间保持；各脚本在第一次选择时才导入
+#加 --timing 参数会打印启动耗时，以及从选择到发出第一个请求的耗时；加 --profile 参数会在每次运行后打印请求各阶段的耗时分解
 
-import subprocess
+import importlib
 import sys
-from rich import print
+import time
 
-# 定义字典
+_started = time.perf_counter()
+
+# 定义字典：功能名称 -> 模块名
 fun_list = {
-    "广告创建": "oppo_ad_creat.py",
-    "媒体状态查询": "oppo_ad_query.py",
-    "收入查询": "oppo_incomes_query.py"
+    "广告创建": "oppo_ad_creat",
+    "媒体状态查询": "oppo_ad_query",
+    "收入查询": "oppo_incomes_query"
 }
 
-file_path='xxx/oppo_Ad/' #脚本的目录
 
-def run_script():
+def run_tool(module_name, timing=False, profile=False):
+    """在当前进程里运行脚本的main，Ctrl+C或脚本退出后回到菜单"""
+    chosen_at = time.perf_counter()
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as e:
+        print(f"运行失败！缺少依赖库：{e.name}")
+        return
+    imported_at = time.perf_counter()
+
+    oppo_client = sys.modules.get("oppo_client")
+    if oppo_client is not None:
+        oppo_client.first_request_at = None
+    if profile:
+        import oppo_metrics
+        oppo_metrics.METRICS.reset() #只统计这一次运行
+
+    try:
+        module.main()
+    except KeyboardInterrupt:
+        print("\n已中断，返回菜单")
+    except SystemExit:
+        pass
+    except Exception as e: #脚本出错也回到菜单，不影响之后的选择
+        print(f"运行出错：{type(e).__name__}: {e}")
+
+    if profile:
+        oppo_metrics.profile_report()
+
+    if timing:
+        print(f"[timing] 导入{module_name}耗时{(imported_at - chosen_at) * 1000:.0f}ms")
+        first_request_at = getattr(oppo_client, "first_request_at", None) if oppo_client else None
+        if first_request_at is not None:
+            print(f"[timing] 从选择到第一个请求耗时{(first_request_at - chosen_at) * 1000:.0f}ms")
+
+
+def run_script(timing=False, profile=False):
+    from rich import print #放到这里导入，选择器启动时不用等rich；rich在Windows控制台上也能正确显示颜色
+    if timing:
+        print(f"\\[timing] 选择器启动耗时{(time.perf_counter() - _started) * 1000:.0f}ms")
+
     while True:
         # 显示功能列表
         print("\n请选择你要执行的脚本：")
@@ -24,18 +67,21 @@ def run_script():
         # 获取用户选择
         try:
             choice = int(input("请输入对应数字选择："))
-            if 1 <= choice <= len(fun_list):
-                selected_function = list(fun_list.values())[choice - 1]
-                print(f"你选择了：{list(fun_list.keys())[choice - 1]}")
-                # 执行选中的脚本
-                subprocess.run([sys.executable, file_path+selected_function])
-            elif choice == len(fun_list) + 1:
-                print("退出程序")
-                break
-            else:
-                print("无效的选择，请输入有效数字！")
         except ValueError:
             print("请输入一个有效的数字！")
+            continue
+
+        if 1 <= choice <= len(fun_list):
+            selected_function = list(fun_list.values())[choice - 1]
+            print(f"你选择了：{list(fun_list.keys())[choice - 1]}")
+            # 执行选中的脚本
+            run_tool(selected_function, timing, profile)
+        elif choice == len(fun_list) + 1:
+            print("退出程序")
+            break
+        else:
+            print("无效的选择，请输入有效数字！")
+
 
-# 调用函数
-run_script()
\ No newline at end of file
+if __name__ == "__main__":
+    run_script(timing="--timing" in sys.argv, profile="--profile" in sys.argv)
@@ -9,10 +9,10 @@ APP_LIST={
         'COMPANY' : '主体名称'
     },
     2:{
-        'APP_NAME': '应用名称',
+        'APP_NAME': '应用名称2',
         'CLIENT_ID': '123123',
         'CLIENT_SECRET':'qwerqwer',
-        'MEDIA_ID':'后台的appid',
+        'MEDIA_ID':'后台的appid2',
         'COMPANY' : '主体名称'
     }
 }
\ No newline at end of file
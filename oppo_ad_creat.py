@@ -36,24 +36,28 @@ def modules_check():
         print("运行失败！以下库未安装：", ", ".join(missing_libs))
         sys.exit(1)
 
-modules_check()
+if __name__ == "__main__": #单独运行时才检查依赖；由选择器导入时跳过，不用每次解析一遍文件
+    modules_check()
 
-import requests # type: ignore
+import argparse
+import csv
 import json
 import time
-import hmac
-import hashlib
-import random
-from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
 from rich import print
 from rich.panel import Panel
 from rich.console import Console
 from rich.highlighter import NullHighlighter
-from oppo_ad_config import APP_LIST #从外部文件读取应用列表信息
+from oppo_app_registry import get_registry #应用列表从注册表读取，第一次用到时才加载
+from oppo_ad_inventory import AdInventory, split_ad_name
+from oppo_ad_journal import CreateJournal, fingerprint
+from oppo_client import OppoAdAPI as BaseOppoAdAPI, not_sent, start_token_refresher #公共的连接池、签名和请求
+from oppo_metrics import enable_profile
 
 console = Console(highlighter=NullHighlighter())
 
-API_DOMAIN = "https://openapi.heytapmobi.com"
+CREATE_WORKERS = 8 #并发创建广告位的线程数，1就是逐个创建
+POS_LIST_PATH = "/union/v1/pos/list" #广告位列表接口，续跑时用来核对结果不明的广告位
 
 
 # 广告位配置模板
@@ -113,64 +117,10 @@ AD_SLOT_TEMPLATES = {
 
 
 
-class OppoAdAPI:
-    def __init__(self, client_id, client_secret, media_id):
-        self.client_id = client_id
-        self.client_secret = client_secret
-        self.media_id = media_id
-        self.access_token = None
-        self.token_expire_time = 0
-
-    def _generate_signature(self, access_token, timestamp, nonce, params):
-        """签名生成算法"""
-        sorted_params = sorted((k, v) for k, v in params.items() if v is not None)
-        param_str = '&'.join(f"{k}={v}" for k, v in sorted_params)
-        base_str = f"access_token={access_token}&timestamp={timestamp}&nonce={nonce}"
-        if param_str:
-            base_str += f"&{param_str}"
-        signature = hmac.new(
-            self.client_secret.encode('utf-8'),
-            base_str.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        return signature
-
-    def get_access_token(self):
-        """获取access_token"""
-        if self.access_token and time.time() < self.token_expire_time:
-            return self.access_token
-
-        url = f"{API_DOMAIN}/oauth2/v1/token"
-        params = {
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "grant_type": "client_credentials"
-        }
-
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("code") == 0:
-                self.access_token = result["data"]["access_token"]
-                self.token_expire_time = time.time() + result["data"]["expire_in"] - 300
-                return self.access_token
-            else:
-                raise Exception(f"获取token失败: {result.get('message')}")
-        except Exception as e:
-            print(f"[red bold]获取access_token出错: {str(e)}")
-            return None
+class OppoAdAPI(BaseOppoAdAPI):
 
     def create_ad_slot(self, slot_data):
         """创建广告位"""
-        if not self.get_access_token():
-            return {"code": -1, "message": "获取access_token失败"}
-
-        url = f"{API_DOMAIN}/union/v1/order/create"
-        timestamp = str(int(time.time() * 1000))
-        nonce = str(random.randint(0, 20000))
-
         params = {
             #特殊情况处理：如果获取不到那么为“”，然后再删掉为空的项目
             k: v for k, v in {
@@ -189,35 +139,27 @@ class OppoAdAPI:
             }.items() if v != ""
         }
 
-        sign = self._generate_signature(
-            access_token=self.access_token,
-            timestamp=timestamp,
-            nonce=nonce,
-            params=params
-        )
+        return self._post("/union/v1/order/create", params)
 
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Authorization": f"{self.access_token}",
-            "X-Client-Send-Utc-Ms": timestamp,
-            "X-Nonce": nonce,
-            "X-Api-Sign": sign
+    def list_ad_slots(self, page=1, rows=10, searching_word=None):
+        """分页查询本应用的广告位，返回items列表；查询失败时抛出异常"""
+        params = {
+            "appId": self.media_id,
+            "page": page,
+            "rows": rows,
+            "searchingWord": searching_word
         }
-
-        sorted_params = sorted(params.items(), key=lambda x: x[0])
-        form_data = urlencode(sorted_params)
-
-        try:
-            response = requests.post(
-                url,
-                headers=headers,
-                data=form_data,
-                timeout=15
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            return {"code": -1, "message": str(e)}
+        response_json = self._post(POS_LIST_PATH, {k: v for k, v in params.items() if v is not None})
+        if response_json.get("code") != 0:
+            raise Exception(response_json.get("message"))
+        return (response_json.get('data') or {}).get('items') or []
+
+    def find_ad_slot(self, pos_name):
+        """按名称在平台上查找本应用的广告位，返回posId，没找到返回None；查询失败时抛出异常"""
+        for item in self.list_ad_slots(searching_word=pos_name):
+            if item.get('posName') == pos_name:
+                return item.get('posId')
+        return None
 
 def select_template():
     """选择广告位模板"""
@@ -237,14 +179,15 @@ def select_template():
 def select_app():
     """选择应用"""
     print("[bold]请选择应用：")
-    for k, v in APP_LIST.items():
+    registry = get_registry()
+    for k, v in registry.apps.items():
         print(f"[blue bold]{k}.[/] {v['APP_NAME']}")
     
     while True:
         try:
             choice = int(input("请输入应用编号: "))
-            if choice in APP_LIST:
-                return APP_LIST[choice]
+            if choice in registry.apps:
+                return registry.apps[choice]
             print("[red]无效的选择，请重新输入")
         except ValueError:
             print("[red]请输入有效的数字")
@@ -256,7 +199,106 @@ def generate_ad_name(app_name, base_name, target_price_title, ad_type, index):
     else:
         return f"{app_name}-{base_name}-{target_price_title}-{index}"
     
-def creat_ads(template, app_name, base_name, api):
+def ad_name_prefix(app_name, base_name, target_price_title, ad_type):
+    """广告位名称去掉序号后的前缀，库存按它查下一个序号"""
+    return split_ad_name(generate_ad_name(app_name, base_name, target_price_title, ad_type, 1))[0]
+
+def load_inventory(api):
+    """读取应用的广告位库存并从平台增量刷新；刷新失败时用本地缓存"""
+    inventory = AdInventory.load(api.media_id)
+    try:
+        added = inventory.refresh(api)
+        inventory.save()
+        if added:
+            print(f"广告位库存新增{added}个")
+    except Exception as e:
+        print(f"[yellow]刷新广告位库存失败，使用本地缓存: {e}")
+    return inventory
+
+def drop_collisions(items, inventory_of, pos_name_of, allowed=()):
+    """去掉和库存里已有广告位重名的项并提示；inventory_of、pos_name_of从每项取库存和名称，allowed里的名称不算重名"""
+    kept = []
+    for item in items:
+        pos_name = pos_name_of(item)
+        inventory = inventory_of(item)
+        if inventory is not None and inventory.has_name(pos_name) and pos_name not in allowed:
+            print(f"[red]广告位已存在，跳过：{pos_name}")
+        else:
+            kept.append(item)
+    return kept
+
+def build_ad_slots(template, app_name, base_name, target_price, count, start_index=1):
+    """按序号生成本次要创建的广告位配置，返回[(序号, 广告位配置, 保价标题)]，顺序与序号一致"""
+    #当为bidding广告时，target_price输入为空，那么就将命名中的目标价改为bidding
+    target_price_title = target_price
+    if target_price=="":
+        target_price_title = 'bidding'
+
+    ad_slots = []
+    for i in range(start_index, count + start_index):
+        # 生成广告位配置
+        ad_slot = template['config'].copy()
+        ad_slot['posName'] = generate_ad_name(app_name, base_name, target_price_title, template['type'], i)
+
+        if target_price!="":
+            ad_slot['targetPriceOpen'] = 1 if target_price > 0 else 0
+        ad_slot['targetPrice'] = target_price
+
+        ad_slots.append((i, ad_slot, target_price_title))
+    return ad_slots
+
+def _timed_create(api, ad_slot, journal=None):
+    """创建单个广告位并记录耗时；有日志时在请求前后各记一条"""
+    if journal is not None:
+        fp = fingerprint(api.media_id, ad_slot)
+        journal.planned(ad_slot['posName'], fp)
+
+    t0 = time.perf_counter()
+    result = api.create_ad_slot(ad_slot)
+    latency = time.perf_counter() - t0
+
+    if journal is not None:
+        if result and result.get("code") == 0:
+            journal.done(ad_slot['posName'], fp, (result.get('data') or {}).get('posId'))
+        elif result and (result.get("code") != -1 or not_sent(result)):
+            journal.failed(ad_slot['posName'], fp, result.get("code"), result.get("message"))
+        #其他code为-1的是网络问题，平台上是否已创建不确定，保持planned状态，重跑时先核对
+    return result, latency
+
+def run_create_jobs(jobs, workers=CREATE_WORKERS, journal=None):
+    """并发执行[(api, 广告位配置)]，返回与jobs顺序一致的[(结果, 耗时)]，并打印吞吐和耗时"""
+    #每个主体先取一次token，提前暴露token问题
+    for api in {id(api): api for api, _ in jobs}.values():
+        api.get_access_token()
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_timed_create, api, ad_slot, journal) for api, ad_slot in jobs]
+        outcomes = [future.result() for future in futures] #按提交顺序取结果，保证和序号一致
+    elapsed = time.perf_counter() - begin
+
+    print_create_stats([latency for _, latency in outcomes], elapsed)
+    return outcomes
+
+def create_ad_slots(api, ad_slots, workers=CREATE_WORKERS):
+    """并发创建广告位，返回与ad_slots顺序一致的[(序号, 广告位配置, 保价标题, 结果, 耗时)]"""
+    outcomes = run_create_jobs([(api, ad_slot) for _, ad_slot, _ in ad_slots], workers)
+    return [
+        (i, ad_slot, target_price_title, result, latency)
+        for (i, ad_slot, target_price_title), (result, latency) in zip(ad_slots, outcomes)
+    ]
+
+def print_create_stats(latencies, elapsed):
+    """打印本次创建的吞吐（个/秒）和单个广告位的耗时"""
+    if not latencies:
+        return
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"[bold]耗时{elapsed:.2f}秒，吞吐{len(latencies) / elapsed:.1f}个/秒；"
+          f"单个广告位耗时 平均={sum(latencies) / len(latencies):.2f}s p50={p50:.2f}s p99={p99:.2f}s 最慢={latencies[-1]:.2f}s")
+
+def creat_ads(template, app_name, base_name, api, workers=CREATE_WORKERS, inventory=None):
     
     #初始化
     all_output=[] 
@@ -276,30 +318,21 @@ def creat_ads(template, app_name, base_name, api):
         return 400
     count = int(count)
     
-    start_index=1 #开始的序号
+    #开始的序号：有库存时接着已有的最大序号往后编
+    start_index=1
+    if inventory is not None:
+        start_index = inventory.next_index(ad_name_prefix(app_name, base_name, target_price if target_price != "" else 'bidding', template['type']))
 
-    success_count = 0
-    for i in range(start_index, count + start_index):
-        # 生成广告位配置
-        ad_slot = template['config'].copy()
+    ad_slots = build_ad_slots(template, app_name, base_name, target_price, count, start_index)
+    ad_slots = drop_collisions(ad_slots, lambda slot: inventory, lambda slot: slot[1]['posName'])
 
-        #当为bidding广告时，target_price输入为空，那么就将命名中的目标价改为bidding
-        target_price_title  = target_price
-        if target_price=="":
-            target_price_title = 'bidding'
-            # print("[red]变量为空或假值")
-
-        ad_slot['posName'] = generate_ad_name(app_name, base_name, target_price_title, template['type'], i)
-
-        if target_price!="":
-            ad_slot['targetPriceOpen'] = 1 if target_price > 0 else 0
-        ad_slot['targetPrice'] = target_price
-
-        # print(f"\n正在创建广告位 {i}/{count}...")
-        result = api.create_ad_slot(ad_slot)
+    success_count = 0
+    for i, ad_slot, target_price_title, result, latency in create_ad_slots(api, ad_slots, workers):
         # print(result)
         
         if result and result.get("code") == 0:
+            if inventory is not None:
+                inventory.add(result.get('data', {}).get('posId'), ad_slot['posName'])
             output = f"[blue]{result.get('data', {}).get('posId')}[/],{ad_slot['posName']},[green]{target_price_title}[/]"
             all_output.append(output)
             print(output) #打印结果格式：广告位id、名称、保价
@@ -309,20 +342,258 @@ def creat_ads(template, app_name, base_name, api):
             print(f"[red]{result}") #打印错误信息
 
     print(f"\n成功创建 {success_count}/{count} 个广告位\n")
+    if inventory is not None:
+        inventory.save()
     
     return all_output    
 
     
 
+def find_app(key):
+    """按应用编号、应用名称或MEDIA_ID查找应用"""
+    app_info = get_registry().find(key)
+    if app_info is None:
+        raise ValueError(f"应用列表中没有应用：{key}")
+    return app_info
+
+def load_manifest(path):
+    """读取CSV或JSON清单，每行包含app、template、base_name、target_price、count
+
+    app可以是应用编号、应用名称或MEDIA_ID；template是AD_SLOT_TEMPLATES编号；bidding模板的target_price留空，其他模板必须填写（可以是0）
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if path.lower().endswith(".json"):
+            return json.load(f)
+        return list(csv.DictReader(f))
+
+def build_plan(rows, inventories=None, resume_indexes=None, refresh=True):
+    """把清单展开成逐个广告位的创建计划，同名前缀在整个计划里连续编号
+
+    inventories传入字典时按应用加载广告位库存，序号接着库存里已有的最大序号；refresh为False时只用本地缓存，不调用接口；
+    resume_indexes是{名称前缀: 起始序号}，续跑时沿用上次计划的编号
+    """
+    resume_indexes = resume_indexes or {}
+    apis = {}
+    next_index = {}
+    plan = []
+    for line_no, row in enumerate(rows, start=1):
+        try:
+            app_info = find_app(row['app'])
+            template = AD_SLOT_TEMPLATES[int(row['template'])]
+            base_name = str(row['base_name']).strip()
+            count = int(row['count'])
+            if count <= 0:
+                raise ValueError(f"count必须大于0：{count}")
+            raw_price = row.get('target_price')
+            raw_price = '' if raw_price is None else str(raw_price).strip() #0也是有效的目标价，不能当成空
+            if "bidding" in template['name']:
+                target_price = ''
+            elif raw_price in ('', 'bidding'):
+                raise ValueError(f"模板{template['name']}不是bidding，必须填写target_price")
+            else:
+                target_price = int(raw_price)
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"清单第{line_no}行有误：{e}")
+
+        key = (app_info['CLIENT_ID'], app_info['MEDIA_ID'])
+        if key not in apis:
+            apis[key] = OppoAdAPI(app_info["CLIENT_ID"], app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+            if inventories is not None and app_info['MEDIA_ID'] not in inventories:
+                inventories[app_info['MEDIA_ID']] = load_inventory(apis[key]) if refresh else AdInventory.load(app_info['MEDIA_ID'])
+        inventory = (inventories or {}).get(app_info['MEDIA_ID'])
+
+        prefix = ad_name_prefix(app_info['APP_NAME'], base_name, target_price if target_price != "" else 'bidding', template['type'])
+        if (app_info['MEDIA_ID'], prefix) not in next_index:
+            if prefix in resume_indexes:
+                next_index[(app_info['MEDIA_ID'], prefix)] = resume_indexes[prefix]
+            else:
+                next_index[(app_info['MEDIA_ID'], prefix)] = inventory.next_index(prefix) if inventory is not None else 1
+        start_index = next_index[(app_info['MEDIA_ID'], prefix)]
+        next_index[(app_info['MEDIA_ID'], prefix)] = start_index + count
+
+        for i, ad_slot, target_price_title in build_ad_slots(template, app_info['APP_NAME'], base_name, target_price, count, start_index):
+            plan.append({
+                'api': apis[key],
+                'app_name': app_info['APP_NAME'],
+                'index': i,
+                'ad_slot': ad_slot,
+                'price': target_price_title,
+            })
+    return plan
+
+def journal_start_indexes(journal):
+    """从日志里取每个名称前缀上次计划的最小序号，续跑时按同样的编号生成计划
+
+    只取还有没完成（结果不明或失败）的前缀；全部创建成功的前缀按库存接着编号
+    """
+    indexes = {}
+    unfinished = set()
+    for pos_name, entry in journal.entries.items():
+        prefix, index = split_ad_name(pos_name)
+        if index is None:
+            continue
+        if index < indexes.get(prefix, index + 1):
+            indexes[prefix] = index
+        if entry["event"] != "done":
+            unfinished.add(prefix)
+    return {prefix: index for prefix, index in indexes.items() if prefix in unfinished}
+
+def _check_unknown(job):
+    """核对结果不明的广告位是否已经在平台上创建，返回posId或None"""
+    return job['api'].find_ad_slot(job['ad_slot']['posName'])
+
+def resume_from_journal(plan, journal, workers=CREATE_WORKERS, inventories=None):
+    """根据日志判断计划里哪些广告位已经处理过，返回{计划下标: 结果}，不在里面的需要重新创建
+
+    已确认创建的直接跳过；结果不明的先看刷新过的库存里有没有，再去平台按名称核对，找到就补记done，
+    没找到才重建，核对失败的跳过避免重复创建
+    """
+    resolved = {}
+    unknown = []
+    for n, job in enumerate(plan):
+        pos_name = job['ad_slot']['posName']
+        state, entry = journal.state(pos_name)
+        if state == "done":
+            if entry["fingerprint"] != fingerprint(job['api'].media_id, job['ad_slot']):
+                print(f"[yellow]{pos_name}已创建过，但参数和本次清单不同，跳过")
+            resolved[n] = {"code": 0, "data": {"posId": entry.get("posId")}}
+        elif state == "unknown":
+            inventory = (inventories or {}).get(job['api'].media_id)
+            pos_id = inventory.pos_id_of(pos_name) if inventory is not None else None
+            if pos_id is not None: #库存里已经有了，说明上次其实创建成功了
+                pos_id = int(pos_id) if pos_id.isdigit() else pos_id #库存按字符串保存posId
+                journal.done(pos_name, fingerprint(job['api'].media_id, job['ad_slot']), pos_id)
+                resolved[n] = {"code": 0, "data": {"posId": pos_id}}
+            else:
+                unknown.append(n)
+
+    if unknown:
+        print(f"有{len(unknown)}个广告位上次结果不明，先到平台核对")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {n: pool.submit(_check_unknown, plan[n]) for n in unknown}
+        for n, future in futures.items():
+            job = plan[n]
+            pos_name = job['ad_slot']['posName']
+            try:
+                pos_id = future.result()
+            except Exception as e:
+                resolved[n] = {"code": -1, "message": f"上次结果不明且核对失败，已跳过：{e}"}
+                continue
+            if pos_id is not None:
+                journal.done(pos_name, fingerprint(job['api'].media_id, job['ad_slot']), pos_id)
+                resolved[n] = {"code": 0, "data": {"posId": pos_id}}
+    return resolved
+
+def run_plan(plan, workers=CREATE_WORKERS, journal=None, inventories=None):
+    """执行创建计划，所有应用共用一个线程池、连接池和token缓存，返回与计划顺序一致的结果记录
+
+    传入journal时会跳过日志里已经创建的广告位，并把本次的每个请求写进日志；inventories用来核对上次结果不明的广告位
+    """
+    outcomes = {}
+    if journal is not None:
+        outcomes = {n: (result, 0.0) for n, result in resume_from_journal(plan, journal, workers, inventories).items()}
+        if outcomes:
+            print(f"根据日志跳过{len(outcomes)}个已处理的广告位")
+    resumed = set(outcomes)
+
+    pending = [n for n in range(len(plan)) if n not in outcomes]
+    if pending:
+        created = run_create_jobs([(plan[n]['api'], plan[n]['ad_slot']) for n in pending], workers, journal)
+        outcomes.update(zip(pending, created))
+
+    records = []
+    for n, job in enumerate(plan):
+        result, latency = outcomes[n]
+        ok = bool(result) and result.get("code") == 0
+        records.append({
+            'app': job['app_name'],
+            'posId': (result.get('data') or {}).get('posId') if ok else None,
+            'posName': job['ad_slot']['posName'],
+            'price': job['price'],
+            'code': result.get('code') if result else None,
+            'message': '' if ok else (result or {}).get('message', ''),
+            'latency': round(latency, 3),
+            'resumed': n in resumed, #True表示根据日志跳过，不是本次创建的
+        })
+    return records
+
+def write_results(records, path):
+    """按扩展名把结果写成JSON或CSV"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".json"):
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=['app', 'posId', 'posName', 'price', 'code', 'message', 'latency', 'resumed'])
+            writer.writeheader()
+            writer.writerows(records)
+
+def batch_main(argv=None):
+    """无交互的批量创建：python oppo_ad_creat.py --manifest plan.csv --out result.json"""
+    parser = argparse.ArgumentParser(description="按清单批量创建oppo广告位")
+    parser.add_argument("--manifest", required=True, help="CSV或JSON清单，字段：app,template,base_name,target_price,count")
+    parser.add_argument("--out", required=True, help="结果文件，.json或.csv")
+    parser.add_argument("--workers", type=int, default=CREATE_WORKERS, help="并发数")
+    parser.add_argument("--dry-run", action="store_true", help="只展开计划并打印，不调用接口（序号按本地缓存的广告位库存）")
+    parser.add_argument("--journal", help="创建日志文件，默认是结果文件名加.journal.jsonl；重跑时据此续跑")
+    parser.add_argument("--profile", action="store_true", help="结束时打印请求各阶段的耗时分解")
+    parser.add_argument("--metrics-out", help="结束时把请求指标写到这个文件，.json为快照，其他为Prometheus文本")
+    args = parser.parse_args(argv)
+
+    enable_profile(args.profile, args.metrics_out)
+
+    journal = CreateJournal(args.journal or f"{args.out}.journal.jsonl")
+    try:
+        inventories = {}
+        plan = build_plan(load_manifest(args.manifest), inventories, journal_start_indexes(journal), refresh=not args.dry_run)
+
+        # 日志里已创建或结果不明的可能是上次创建的，不算重名，交给resume_from_journal处理
+        journaled = {name for name, entry in journal.entries.items() if entry["event"] != "failed"}
+        plan = drop_collisions(
+            plan,
+            lambda job: inventories.get(job['api'].media_id),
+            lambda job: job['ad_slot']['posName'],
+            journaled
+        )
+        print(f"计划创建{len(plan)}个广告位，涉及{len({id(job['api']) for job in plan})}个应用")
+        if args.dry_run:
+            for job in plan:
+                print(f"{job['ad_slot']['posName']},{job['price']}")
+            return
+
+        start_token_refresher()
+        records = run_plan(plan, args.workers, journal, inventories)
+        if journal.all_done(): #全部创建成功，归档日志，同样的清单再跑一次会接着库存创建新的广告位
+            print(f"日志已归档到{journal.archive()}")
+    finally:
+        journal.close()
+    write_results(records, args.out)
+
+    # 新建的广告位记入库存，下次编号接着往后
+    for job, record in zip(plan, records):
+        if record['posId'] is not None:
+            inventories[job['api'].media_id].add(record['posId'], record['posName'])
+    for inventory in inventories.values():
+        inventory.save()
+
+    success_count = sum(1 for record in records if record['posId'] is not None)
+    created_count = sum(1 for record in records if record['posId'] is not None and not record['resumed'])
+    print(f"\n成功 {success_count}/{len(records)} 个广告位（本次创建{created_count}个，"
+          f"日志中已创建{success_count - created_count}个），结果已写入{args.out}\n")
+    if success_count < len(records):
+        sys.exit(1)
+
 def main():
 
     print(Panel("[red]* 依次选择或输入“应用-广告类型-名称-保价-数量”创建广告\n* 广告位名称规则：应用名称-基础名称-保价-序号\n* 保价或数量输入“t”可退出创建，并输出本次所有创建的广告信息", title="欢迎使用oppo广告创建脚本"))
 
+    start_token_refresher() #后台提前续期token，长时间运行时请求不用等token
+
     #选择应用配置
     app_info=select_app()
     print(f'【已选择{app_info["APP_NAME"]}】')
     
     api = OppoAdAPI(app_info["CLIENT_ID"],app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+    inventory = load_inventory(api)
     
     # 选择广告位模板
     template = select_template()
@@ -335,7 +606,7 @@ def main():
 
     for _ in range(100):
        
-       ads_output=creat_ads(template, app_info["APP_NAME"], base_name, api)
+       ads_output=creat_ads(template, app_info["APP_NAME"], base_name, api, inventory=inventory)
        
        #如果输入了t，那么函数会收到400的消息，那么就打印所有收到的结果，退出循环；否则就加入列表，继续循环
        if ads_output == 400:
@@ -349,4 +620,7 @@ def main():
         
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1: #带参数时走清单批量模式，否则交互式创建
+        batch_main()
+    else:
+        main()
\ No newline at end of file
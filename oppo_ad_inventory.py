@@ -0,0 +1,96 @@
+# 本地缓存的广告位清单：按MEDIA_ID保存已有的广告位，按名称前缀（去掉最后的序号）建索引
+# 创建广告位时直接取下一个没用过的序号，并在调用接口前发现重名
+
+import json
+import os
+import time
+
+# 缓存目录，可以用环境变量OPPO_INVENTORY_DIR改到别处
+INVENTORY_DIR = os.environ.get(
+    "OPPO_INVENTORY_DIR",
+    os.path.join(os.path.expanduser("~"), ".oppo_ad", "inventory")
+)
+
+INVENTORY_PAGE_ROWS = 100 #刷新时每页拉取的条数
+
+
+def split_ad_name(pos_name):
+    """把generate_ad_name生成的名称拆成(前缀, 序号)；最后一段不是数字时返回(名称, None)"""
+    prefix, sep, index = pos_name.rpartition('-')
+    if sep and index.isdigit():
+        return prefix, int(index)
+    return pos_name, None
+
+
+class AdInventory:
+    """一个应用的广告位清单"""
+
+    def __init__(self, media_id, path=None):
+        self.media_id = str(media_id)
+        self.path = path or os.path.join(INVENTORY_DIR, f"{self.media_id}.json")
+        self.slots = {} #posId -> posName
+        self.refreshed_at = 0
+        self._names = {} #posName -> posId
+        self._max_index = {} #名称前缀 -> 已用的最大序号
+
+    @classmethod
+    def load(cls, media_id, path=None):
+        """读取本地缓存，没有缓存时返回空清单"""
+        inventory = cls(media_id, path)
+        try:
+            with open(inventory.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return inventory
+        inventory.refreshed_at = data.get("refreshed_at", 0)
+        for pos_id, pos_name in data.get("slots", {}).items():
+            inventory.add(pos_id, pos_name)
+        return inventory
+
+    def save(self):
+        """先写临时文件再替换"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"refreshed_at": self.refreshed_at, "slots": self.slots}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def add(self, pos_id, pos_name):
+        """记录一个广告位，返回它是不是新的"""
+        pos_id = str(pos_id)
+        if pos_id in self.slots:
+            return False
+        self.slots[pos_id] = pos_name
+        self._names.setdefault(pos_name, pos_id)
+        prefix, index = split_ad_name(pos_name)
+        if index is not None and index > self._max_index.get(prefix, 0):
+            self._max_index[prefix] = index
+        return True
+
+    def has_name(self, pos_name):
+        return pos_name in self._names
+
+    def pos_id_of(self, pos_name):
+        """按名称取posId，没有时返回None"""
+        return self._names.get(pos_name)
+
+    def next_index(self, prefix):
+        """该前缀下一个可用的序号"""
+        return self._max_index.get(prefix, 0) + 1
+
+    def refresh(self, api, full=False, rows=INVENTORY_PAGE_ROWS):
+        """从平台同步广告位，返回新增的个数；失败时抛出异常
+
+        增量刷新时遇到整页都是已知广告位就停止（列表按创建时间倒序返回）；full为True时拉取全部
+        """
+        added = 0
+        page = 1
+        while True:
+            items = api.list_ad_slots(page, rows)
+            page_added = sum(1 for item in items if self.add(item.get('posId'), item.get('posName')))
+            added += page_added
+            if len(items) < rows or (not full and page_added == 0):
+                break
+            page += 1
+        self.refreshed_at = time.time()
+        return added
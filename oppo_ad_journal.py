@@ -0,0 +1,97 @@
+# 批量创建广告位的日志：每个广告位在请求前记一条planned，返回后记done或failed，都是追加写入
+# 进程中途退出后重跑时，已确认创建的直接跳过，结果不明的先去平台核对再决定是否重建；全部创建成功后日志归档，下次从头开始
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def fingerprint(media_id, ad_slot):
+    """广告位请求的指纹：应用+全部参数，参数一样指纹就一样"""
+    payload = json.dumps({"appId": media_id, **ad_slot}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class CreateJournal:
+    """追加写入的JSONL日志，按posName记录每个广告位最后的状态"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = self._load()
+        self._file = None #第一次写入时才打开，只读日志（比如--dry-run）不会创建文件
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            self._file.write("\n") #上次最后一行只写了一半，先补上换行，别和新记录连在一起
+
+    def _load(self):
+        """读取已有日志，返回{posName: 最后一条记录}；最后一行写了一半时忽略"""
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry["posName"]] = entry
+        return entries
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _append(self, entry):
+        entry["ts"] = time.time()
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno()) #确保写到磁盘，进程被杀也不会丢
+            self.entries[entry["posName"]] = entry
+
+    def planned(self, pos_name, fp):
+        """请求发出前记录"""
+        self._append({"event": "planned", "posName": pos_name, "fingerprint": fp})
+
+    def done(self, pos_name, fp, pos_id):
+        """确认创建成功"""
+        self._append({"event": "done", "posName": pos_name, "fingerprint": fp, "posId": pos_id})
+
+    def failed(self, pos_name, fp, code, message):
+        """平台明确返回失败，广告位没有创建"""
+        self._append({"event": "failed", "posName": pos_name, "fingerprint": fp, "code": code, "message": message})
+
+    def state(self, pos_name):
+        """返回广告位的状态：None没记录过，done已创建，failed失败，unknown请求发出后没有结果"""
+        entry = self.entries.get(pos_name)
+        if entry is None:
+            return None, None
+        if entry["event"] == "planned":
+            return "unknown", entry
+        return entry["event"], entry
+
+    def all_done(self):
+        """日志里的广告位是不是都已确认创建"""
+        return bool(self.entries) and all(entry["event"] == "done" for entry in self.entries.values())
+
+    def archive(self):
+        """关闭日志并改名归档，返回归档后的路径；同一个结果文件下次运行时会用新的日志"""
+        self.close()
+        archived = f"{self.path}.{time.strftime('%Y%m%d%H%M%S')}"
+        os.replace(self.path, archived)
+        self.entries = {}
+        return archived
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
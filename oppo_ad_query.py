@@ -1,185 +1,347 @@
-import requests # type: ignore
 import json
 import time
-import hmac
-import hashlib
-import random
-from urllib.parse import urlencode
-from playsound import playsound
-import time
 from datetime import datetime
 import os
-import sys
 import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from rich import print
-from oppo_ad_config import APP_LIST #从外部文件读取应用列表信息
-
-API_DOMAIN = "https://openapi.heytapmobi.com"
-
-
-class OppoAdAPI:
-    def __init__(self, client_id, client_secret, media_id):
-        self.client_id = client_id
-        self.client_secret = client_secret
-        self.media_id = media_id
-        self.access_token = None
-        self.token_expire_time = 0
-
-    def _generate_signature(self, access_token, timestamp, nonce, params):
-        """签名生成算法"""
-        sorted_params = sorted((k, v) for k, v in params.items() if v is not None)
-        param_str = '&'.join(f"{k}={v}" for k, v in sorted_params)
-        base_str = f"access_token={access_token}&timestamp={timestamp}&nonce={nonce}"
-        if param_str:
-            base_str += f"&{param_str}"
-        signature = hmac.new(
-            self.client_secret.encode('utf-8'),
-            base_str.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        return signature
-
-    def get_access_token(self):
-        """获取access_token"""
-        if self.access_token and time.time() < self.token_expire_time:
-            return self.access_token
-
-        url = f"{API_DOMAIN}/oauth2/v1/token"
-        params = {
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "grant_type": "client_credentials"
-        }
-
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("code") == 0:
-                self.access_token = result["data"]["access_token"]
-                self.token_expire_time = time.time() + result["data"]["expire_in"] - 300
-                return self.access_token
-            else:
-                raise Exception(f"获取token失败: {result.get('message')}")
-        except Exception as e:
-            print(f"获取access_token出错: {str(e)}")
-            return None
-
+from oppo_app_registry import get_registry #应用列表从注册表读取，第一次用到时才加载
+from oppo_client import OppoAdAPI as BaseOppoAdAPI, start_token_refresher #公共的连接池、签名和请求
+from oppo_media_events import MISSING, DesktopSink, FileSink, MediaEvents, SoundSink, StatusSnapshot, WebhookSink
+
+
+QUERY_MODE = "adaptive" #adaptive：按每个应用的状态自适应间隔；sweep：每个主体分页拉一次完整应用列表再本地匹配；search：逐个应用按名称搜索
+SWEEP_PAGE_ROWS = 100 #整页拉取时每页的条数
+SWEEP_WORKERS = 8 #同时拉取的主体数
+
+# adaptive模式下每个应用的查询间隔（秒）
+MEDIA_HOT_INTERVAL = 180 #刚变化过的应用
+MEDIA_FROZEN_INTERVAL = 600 #冻结的应用，等它恢复
+MEDIA_BASE_INTERVAL = 900 #新加入的应用从这个间隔开始
+MEDIA_MAX_INTERVAL = 1800 #长期稳定的应用最多隔这么久查一次
+MEDIA_BACKOFF = 1.5 #每次查询没有变化，间隔乘以这个系数
+MEDIA_HOT_PERIOD = 1800 #变化后这么久之内都按MEDIA_HOT_INTERVAL查询
+MEDIA_SPREAD = 0.2 #下次查询时间在间隔的±20%内随机，请求不会挤在一起
+MEDIA_COALESCE = 0.5 #主体里有应用到期时，剩余等待不到自身间隔一半的应用一起查
+
+# 状态变化时的提醒，都在后台线程里处理，不影响查询
+ALERT_SOUND_FILE = "asasd/y2080.mp3" #提醒声音的地址，None不播放
+ALERT_DESKTOP = True #桌面通知
+ALERT_LOG_FILE = os.path.join(os.path.expanduser("~"), ".oppo_ad", "media_events.jsonl") #事件记录文件，None不记录
+ALERT_WEBHOOK = os.environ.get("OPPO_ALERT_WEBHOOK") #本地webhook地址，例如http://127.0.0.1:9000/oppo，不设置则不发送
+
+
+def status_text(status):
+    """把unionStatus转成展示用的文字"""
+    if status == 4:
+        return '【冻结】'
+    elif status == 2:
+        return '正常'
+    else:
+        return '没找到'
+
+def print_status(result):
+    """打印一条媒体状态，冻结的标红"""
+    if "冻结" in result:
+        print(f"[red bold]{result}[/]")
+    else:
+        print(result)
+
+
+class OppoAdAPI(BaseOppoAdAPI):
 
     def media_query(self, app_name):
-        """创建广告位"""
-        if not self.get_access_token():
-            return {"code": -1, "message": "获取access_token失败"}
-
-        url = "https://openapi.heytapmobi.com/union/v1/app/list"
-        timestamp = str(int(time.time() * 1000))
-        nonce = str(random.randint(0, 20000))
-
+        """查询媒体状态"""
         params = {
             "page": 1,
             "rows":10,
             "searchingWord":app_name
         }
 
-        sign = self._generate_signature(
-            access_token=self.access_token,
-            timestamp=timestamp,
-            nonce=nonce,
-            params=params
-        )
-
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Authorization": f"{self.access_token}",
-            "X-Client-Send-Utc-Ms": timestamp,
-            "X-Nonce": nonce,
-            "X-Api-Sign": sign
-        }
-
-        sorted_params = sorted(params.items(), key=lambda x: x[0])
-        form_data = urlencode(sorted_params)
-
-        try:
-            response = requests.post(
-                url,
-                headers=headers,
-                data=form_data,
-                timeout=15
-            )
-            response.raise_for_status()
-            # print(response.json())
-
-            result_json = response.json().get('data', {}).get('items', [])
-            # print(result_json)
-            if result_json != []:
-                for item in result_json:
-                    name = item.get('mediaName')
-                    status = item.get('unionStatus')
-                    if status == 4:
-                        status = '【冻结】'
-                    elif status == 2:
-                        status = '正常'
-                    else:
-                        status = '没找到'
-                    result=f"{name}:{status}"
-                    if "冻结" in result:
-                        print(f"[red bold]result[/]")
-                    else:
-                        print(result)
-                    return(result)
+        response_json = self._post("/union/v1/app/list", params)
+        if response_json.get("code") == -1: #请求失败时原样返回错误信息
+            return response_json
+        # print(response_json)
+
+        result_json = (response_json.get('data') or {}).get('items', [])
+        # print(result_json)
+        if result_json != []:
+            for item in result_json:
+                result=f"{item.get('mediaName')}:{status_text(item.get('unionStatus'))}"
+                print_status(result)
+                return(result)
+        else:
+            print(f'{app_name}:没找到')
+
+    def search_media(self, app_name, rows=10):
+        """按名称搜索应用，返回items列表；请求失败时抛出异常"""
+        response_json = self._post("/union/v1/app/list", {"page": 1, "rows": rows, "searchingWord": app_name})
+        if response_json.get("code") != 0:
+            raise Exception(response_json.get("message"))
+        return (response_json.get('data') or {}).get('items') or []
+
+    def list_all_media(self, rows=SWEEP_PAGE_ROWS):
+        """分页拉取这个主体下的全部应用，返回items列表；请求失败时抛出异常"""
+        items = []
+        page = 1
+        while True:
+            response_json = self._post("/union/v1/app/list", {"page": page, "rows": rows})
+            if response_json.get("code") != 0:
+                raise Exception(response_json.get("message"))
+
+            data = response_json.get('data') or {}
+            page_items = data.get('items') or []
+            items.extend(page_items)
+            if not page_items:
+                return items
+            total = data.get('total')
+            if total is not None:
+                # 平台可能把rows限制得比请求的小，有total时按total判断是否拉完
+                if len(items) >= int(total):
+                    return items
+            elif len(page_items) < rows: #没有total时，不满一页说明已经是最后一页
+                return items
+            page += 1
+
+def _company_credentials(app_list):
+    """按CLIENT_ID把应用列表分组，同一个主体只需要拉一次应用列表"""
+    groups = {}
+    for app_info in app_list.values():
+        groups.setdefault(app_info["CLIENT_ID"], []).append(app_info)
+    return groups
+
+def _media_index(items):
+    """把接口返回的应用建成本地索引：MEDIA_ID和应用名都能查到，MEDIA_ID优先"""
+    index = {}
+    for item in items:
+        index[("name", item.get('mediaName'))] = item
+    for item in items:
+        index[("id", str(item.get('appId')))] = item
+    return index
+
+def _match_media(index, app_info):
+    return index.get(("id", str(app_info["MEDIA_ID"]))) or index.get(("name", app_info["APP_NAME"]))
+
+def media_sweep(app_list=None, workers=SWEEP_WORKERS, events=None):
+    """按主体并发整页拉取应用列表，在本地按MEDIA_ID或名称匹配应用列表，返回和应用列表顺序一致的状态列表
+
+    传入events（MediaEvents）时，查到的状态会和快照比较，有变化就发出事件
+    """
+    if app_list is None:
+        app_list = get_registry().apps
+    groups = _company_credentials(app_list)
+
+    def fetch(apps):
+        app_info = apps[0]
+        api = OppoAdAPI(app_info["CLIENT_ID"], app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+        return api.list_all_media()
+
+    # 每个主体的结果建一个本地索引：MEDIA_ID和应用名都能查到
+    indexes = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(groups)))) as pool:
+        futures = {client_id: pool.submit(fetch, apps) for client_id, apps in groups.items()}
+        for client_id, future in futures.items():
+            try:
+                items = future.result()
+            except Exception as e:
+                print(f"[red]主体{groups[client_id][0]['COMPANY']}查询失败: {e}")
+                continue
+            indexes[client_id] = _media_index(items)
+
+    results = []
+    for app_info in app_list.values():
+        index = indexes.get(app_info["CLIENT_ID"])
+        if index is None:
+            result = f"{app_info['APP_NAME']}:查询失败"
+        else:
+            item = _match_media(index, app_info)
+            if item:
+                result = f"{item.get('mediaName')}:{status_text(item.get('unionStatus'))}"
             else:
-                print(f'{app_name}:没找到')
-
-        except requests.exceptions.RequestException as e:
-            return {"code": -1, "message": str(e)}
-
-def play_sound(file_path):
-    
-    try:
-        playsound(file_path)
-    except Exception as e:
-        print(f"播放失败: {e}")
+                result = f"{app_info['APP_NAME']}:没找到"
+            if events is not None:
+                events.observe(app_info, item.get('unionStatus') if item else MISSING)
+        print_status(result)
+        results.append(result)
+    if events is not None:
+        events.commit()
+    return results
+
+class AppWatch:
+    """一个应用的轮询状态"""
+
+    def __init__(self, app_info, next_due):
+        self.app_info = app_info
+        self.status = None #上次看到的unionStatus，没找到时为0
+        self.interval = MEDIA_BASE_INTERVAL
+        self.next_due = next_due
+        self.changed_at = None
+
+
+class AdaptiveMediaPoller:
+    """按应用自适应间隔轮询媒体状态
+
+    冻结和刚变化过的应用查得勤，长期稳定的应用逐步放宽到MEDIA_MAX_INTERVAL；每个应用的下次查询时间随机错开。
+    到期的应用按主体分组，同主体里快到期的应用顺带一起查；
+    要查的个数不少于整页拉取的页数时整页拉取（顺便刷新这个主体的全部应用），否则逐个搜索。
+    """
+
+    def __init__(self, app_list=None, clock=time.time, workers=SWEEP_WORKERS, events=None):
+        if app_list is None:
+            app_list = get_registry().apps
+        self.clock = clock
+        self.workers = workers
+        self.events = events #MediaEvents，状态和快照比较后发出变化事件
+        self.groups = _company_credentials(app_list)
+        self.pages = {client_id: -(-len(apps) // SWEEP_PAGE_ROWS) for client_id, apps in self.groups.items()}
+        now = clock()
+        # 第一轮全部查一次建立基线
+        self.watches = {id(app_info): AppWatch(app_info, now) for apps in self.groups.values() for app_info in apps}
+        self.requests = 0 #累计请求次数
+
+    def next_due(self):
+        return min(watch.next_due for watch in self.watches.values())
+
+    def _schedule(self, watch, now):
+        if watch.changed_at is not None and now - watch.changed_at < MEDIA_HOT_PERIOD:
+            watch.interval = MEDIA_HOT_INTERVAL
+        elif watch.status == 4:
+            watch.interval = MEDIA_FROZEN_INTERVAL
+        else:
+            watch.interval = min(MEDIA_MAX_INTERVAL, max(MEDIA_BASE_INTERVAL, watch.interval * MEDIA_BACKOFF))
+        watch.next_due = now + watch.interval * random.uniform(1 - MEDIA_SPREAD, 1 + MEDIA_SPREAD)
+
+    def _observe(self, watch, item, now):
+        """记录一次查询结果，状态变了返回(旧状态, 新状态)"""
+        status = item.get('unionStatus') if item else MISSING
+        change = None
+        if watch.status is not None and status != watch.status:
+            change = (watch.status, status)
+            watch.changed_at = now
+            watch.interval = MEDIA_HOT_INTERVAL
+        watch.status = status
+        self._schedule(watch, now)
+        return change
+
+    def _fetch(self, client_id, due):
+        """查询一个主体下到期的应用，返回{id(app_info): item或None}"""
+        apps = self.groups[client_id]
+        api = OppoAdAPI(apps[0]["CLIENT_ID"], apps[0]["CLIENT_SECRET"], apps[0]["MEDIA_ID"])
+        if len(due) >= self.pages[client_id]:
+            items = api.list_all_media()
+            self.pages[client_id] = max(1, -(-len(items) // SWEEP_PAGE_ROWS))
+            self.requests += self.pages[client_id]
+            index = _media_index(items)
+            return {id(app_info): _match_media(index, app_info) for app_info in apps}
+        found = {}
+        for watch in due:
+            self.requests += 1
+            index = _media_index(api.search_media(watch.app_info["APP_NAME"]))
+            found[id(watch.app_info)] = _match_media(index, watch.app_info)
+        return found
+
+    def poll(self):
+        """查询所有到期的应用，打印结果，返回状态有变化的[(app_info, 旧状态, 新状态)]"""
+        now = self.clock()
+        due_clients = {watch.app_info["CLIENT_ID"] for watch in self.watches.values() if watch.next_due <= now}
+        if not due_clients:
+            return []
+        due_groups = {}
+        for watch in self.watches.values():
+            client_id = watch.app_info["CLIENT_ID"]
+            if client_id in due_clients and watch.next_due - now <= watch.interval * MEDIA_COALESCE:
+                due_groups.setdefault(client_id, []).append(watch)
+
+        print("当前时间是：", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        changes = []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(due_groups)))) as pool:
+            futures = {client_id: pool.submit(self._fetch, client_id, due) for client_id, due in due_groups.items()}
+            for client_id, future in futures.items():
+                due = due_groups[client_id]
+                try:
+                    found = future.result()
+                except Exception as e:
+                    print(f"[red]主体{due[0].app_info['COMPANY']}查询失败: {e}")
+                    for watch in due: #失败的按最短间隔重试
+                        watch.next_due = now + MEDIA_HOT_INTERVAL
+                    continue
+                due_keys = {id(watch.app_info) for watch in due}
+                for key, item in found.items():
+                    watch = self.watches[key]
+                    change = self._observe(watch, item, now)
+                    if change:
+                        changes.append((watch.app_info, *change))
+                    if change or key in due_keys:
+                        name = item.get('mediaName') if item else watch.app_info['APP_NAME']
+                        print_status(f"{name}:{status_text(watch.status)}")
+                    if self.events is not None:
+                        self.events.observe(watch.app_info, watch.status)
+        if self.events is not None:
+            self.events.commit()
+        return changes
+
+def countdown(seconds):
+    """倒计时等待，每秒刷新一次剩余时间"""
+    for ti in range(seconds):
+        time.sleep(1)
+        print(f'距离下次查询还有{seconds - ti-1}秒', end="\r")
+        sys.stdout.flush()
+    print("\n")
+
+def media_events():
+    """按ALERT_*的设置组装状态变化事件流"""
+    sinks = []
+    if ALERT_SOUND_FILE:
+        if os.path.exists(ALERT_SOUND_FILE):
+            sinks.append(SoundSink(ALERT_SOUND_FILE))
+        else:
+            print(f"[yellow]提醒声音文件{ALERT_SOUND_FILE}不存在，不播放声音")
+    if ALERT_DESKTOP:
+        sinks.append(DesktopSink())
+    if ALERT_LOG_FILE:
+        sinks.append(FileSink(ALERT_LOG_FILE))
+    if ALERT_WEBHOOK:
+        sinks.append(WebhookSink(ALERT_WEBHOOK))
+    return MediaEvents(StatusSnapshot.load(), sinks, status_text)
 
 def main():
 
-    text=[]
-    
-
-    for t in range(100000): 
-
-        new=[] #初始化本轮的结果
-
-        now = datetime.now()
-        print("当前时间是：", now.strftime("%Y-%m-%d %H:%M:%S"))
+    start_token_refresher() #后台提前续期token，长时间运行时请求不用等token
 
-        for i in APP_LIST:
-            app_info=APP_LIST[i]
-            
-            api = OppoAdAPI(app_info["CLIENT_ID"],app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
-            new.append(api.media_query(app_info["APP_NAME"]))
-
-            time.sleep(random.uniform(0.1,0.6)) 
-        
-        # print(f"这是text：{text}")
-        # print(f"这是new：{new}")
-
-        # if new != text: #比较本轮的结果和上一轮的结果，如果有变化，那么提示
-        #     print("【有新变化，请注意！】")
-        #     play_sound("asasd/y2080.mp3") #提醒声音的地址
-
-        # text = new #将本轮的结果存下来
-
-
-        duration=15 #下次查询的分钟数
+    events = media_events() #和上次保存的快照比较，只有状态变化时才提醒
+    try:
+        if QUERY_MODE == "adaptive":
+            poller = AdaptiveMediaPoller(events=events)
+            while True:
+                poller.poll()
+                countdown(max(1, int(poller.next_due() - time.time()) + 1))
 
-        for ti in range(duration*60):
-            time.sleep(1)
-            print(f'距离下次查询还有{duration*60 - ti-1}秒', end="\r")
-            sys.stdout.flush()
+        for t in range(100000): 
 
-        print("\n")
+            now = datetime.now()
+            print("当前时间是：", now.strftime("%Y-%m-%d %H:%M:%S"))
 
+            if QUERY_MODE == "sweep":
+                media_sweep(events=events)
+            else:
+                for app_info in get_registry():
+
+                    api = OppoAdAPI(app_info["CLIENT_ID"],app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+                    try: #请求节奏由oppo_client的限速器控制
+                        item = _match_media(_media_index(api.search_media(app_info["APP_NAME"])), app_info)
+                    except Exception as e:
+                        print(f"[red]{app_info['APP_NAME']}查询失败: {e}")
+                        continue
+                    print_status(f"{item.get('mediaName') if item else app_info['APP_NAME']}:{status_text(item.get('unionStatus') if item else None)}")
+                    events.observe(app_info, item.get('unionStatus') if item else MISSING)
+                events.commit()
+
+            duration=15 #下次查询的分钟数
+
+            countdown(duration*60)
+    finally: #Ctrl+C退出时也把排队的提醒处理完、保存快照
+        events.close()
 
     
 if __name__ == "__main__":
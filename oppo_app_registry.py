@@ -0,0 +1,145 @@
+# 应用注册表：从JSON/CSV/SQLite文件或oppo_ad_config.APP_LIST加载应用，只校验一次，按主体、CLIENT_ID、MEDIA_ID、应用名建好索引
+# 用环境变量OPPO_APP_REGISTRY指定文件（.json/.csv/.db/.sqlite），不设置时使用oppo_ad_config.APP_LIST
+# JSON可以是和APP_LIST一样的{编号: 应用}，也可以是应用列表；CSV表头和SQLite的apps表字段为APP_NAME,CLIENT_ID,CLIENT_SECRET,MEDIA_ID,COMPANY
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+
+from rich import print
+
+REGISTRY_PATH = os.environ.get("OPPO_APP_REGISTRY")
+
+REQUIRED_FIELDS = ("APP_NAME", "CLIENT_ID", "CLIENT_SECRET", "MEDIA_ID", "COMPANY")
+SQLITE_TABLE = "apps"
+
+
+def _numbered(rows):
+    return {index: dict(row) for index, row in enumerate(rows, start=1)}
+
+
+def _load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return _numbered(data)
+    return {int(key) if str(key).isdigit() else key: value for key, value in data.items()}
+
+
+def _load_csv(path):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return _numbered(csv.DictReader(f))
+
+
+def _load_sqlite(path):
+    conn = sqlite3.connect(path)
+    try:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(f"SELECT {', '.join(REQUIRED_FIELDS)} FROM {SQLITE_TABLE} ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+    return _numbered(rows)
+
+
+def load_apps(path):
+    """按扩展名读取应用文件，返回{编号: 应用}"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        return _load_json(path)
+    if ext == ".csv":
+        return _load_csv(path)
+    if ext in (".db", ".sqlite", ".sqlite3"):
+        return _load_sqlite(path)
+    raise ValueError(f"不支持的应用文件格式：{path}")
+
+
+class AppRegistry:
+    """校验过的应用列表和索引，查询都是字典/集合查找"""
+
+    def __init__(self, apps):
+        self.apps = {} #编号 -> 应用，和APP_LIST的结构一样
+        self.by_media_id = {}
+        self.by_name = {} #应用名 -> 第一个同名应用
+        self.by_client_id = {} #CLIENT_ID -> [应用]
+        self.by_company = {} #主体 -> [应用]
+        errors = []
+
+        for key, app_info in apps.items():
+            app_info = {field: str(value).strip() if value is not None else "" for field, value in app_info.items()}
+            missing = [field for field in REQUIRED_FIELDS if not app_info.get(field)]
+            if missing:
+                errors.append(f"应用{key}缺少{','.join(missing)}")
+                continue
+            media_id = app_info["MEDIA_ID"]
+            if self.by_media_id.get(media_id) == app_info: #完全相同的重复行（比如没改的示例配置）只提醒，不报错
+                print(f"[yellow]应用{key}和之前的应用完全相同，已忽略")
+                continue
+            if media_id in self.by_media_id:
+                errors.append(f"应用{key}的MEDIA_ID {media_id}重复")
+                continue
+            first = (self.by_client_id.get(app_info["CLIENT_ID"]) or [None])[0]
+            if first is not None and first["CLIENT_SECRET"] != app_info["CLIENT_SECRET"]:
+                errors.append(f"应用{key}的CLIENT_SECRET和同一CLIENT_ID的其他应用不一致")
+                continue
+            company_first = (self.by_company.get(app_info["COMPANY"]) or [None])[0]
+            if company_first is not None and company_first["CLIENT_ID"] != app_info["CLIENT_ID"]:
+                errors.append(f"应用{key}的主体{app_info['COMPANY']}对应了不止一个CLIENT_ID")
+                continue
+
+            self.apps[key] = app_info
+            self.by_media_id[media_id] = app_info
+            self.by_name.setdefault(app_info["APP_NAME"], app_info)
+            self.by_client_id.setdefault(app_info["CLIENT_ID"], []).append(app_info)
+            self.by_company.setdefault(app_info["COMPANY"], []).append(app_info)
+
+        if errors:
+            raise ValueError("应用配置有误：\n" + "\n".join(errors))
+
+        self.app_names = frozenset(self.by_name)
+        self._keys = {str(key): key for key in self.apps}
+
+    def __len__(self):
+        return len(self.apps)
+
+    def __iter__(self):
+        return iter(self.apps.values())
+
+    def company_apps(self):
+        """每个主体取第一个应用（收入按主体查询），返回{编号: 应用}"""
+        return {key: app_info for key, app_info in self.apps.items() if self.by_company[app_info["COMPANY"]][0] is app_info}
+
+    def find(self, key):
+        """按编号、应用名或MEDIA_ID查找，找不到返回None"""
+        key = str(key).strip()
+        if key in self._keys:
+            return self.apps[self._keys[key]]
+        return self.by_name.get(key) or self.by_media_id.get(key)
+
+
+_registry = None
+_lock = threading.Lock()
+
+
+def get_registry():
+    """第一次调用时加载并校验，之后直接返回"""
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                if REGISTRY_PATH:
+                    apps = load_apps(REGISTRY_PATH)
+                else:
+                    from oppo_ad_config import APP_LIST
+                    apps = APP_LIST
+                _registry = AppRegistry(apps)
+    return _registry
+
+
+def use_apps(apps):
+    """换成指定的应用列表（压测时用），返回新的注册表"""
+    global _registry
+    with _lock:
+        _registry = AppRegistry(apps)
+    return _registry
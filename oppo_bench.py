@@ -0,0 +1,430 @@
+# oppo联盟脚本的性能基准：对比不同实现下每次请求的耗时
+
+import argparse
+import contextlib
+import hashlib
+import hmac
+import io
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlencode
+
+import requests # type: ignore
+from rich import print
+
+import oppo_client
+import oppo_metrics
+
+
+def _percentile(values, p):
+    """取第p百分位（0-100）的值，values需已排序"""
+    if not values:
+        return 0.0
+    k = max(0, min(len(values) - 1, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def _report(title, latencies, elapsed):
+    """打印一组请求的吞吐和延迟分布，单位毫秒"""
+    latencies = sorted(latencies)
+    print(f"[bold]{title}[/]: {len(latencies)}次, {len(latencies) / elapsed:.1f} req/s, "
+          f"平均={statistics.mean(latencies) * 1000:.1f}ms, "
+          f"p50={_percentile(latencies, 50) * 1000:.1f}ms, "
+          f"p99={_percentile(latencies, 99) * 1000:.1f}ms")
+
+
+def _timed_calls(call, count):
+    """顺序调用count次，返回每次耗时和总耗时"""
+    latencies = []
+    begin = time.perf_counter()
+    for _ in range(count):
+        t0 = time.perf_counter()
+        try:
+            call()
+        except requests.exceptions.RequestException as e:
+            print(f"[red]请求出错: {e}")
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - begin
+
+
+def bench_client(url, count):
+    """对比每次新建连接的requests.get与连接池session的单次请求耗时"""
+    params = {"client_id": "bench", "client_secret": "bench", "grant_type": "client_credentials"}
+
+    latencies, elapsed = _timed_calls(lambda: requests.get(url, params=params, timeout=15), count)
+    _report("requests.get（每次新建连接）", latencies, elapsed)
+
+    session = oppo_client.get_session(url)
+    latencies, elapsed = _timed_calls(lambda: session.get(url, params=params, timeout=15), count)
+    _report("连接池session（长连接复用）", latencies, elapsed)
+
+
+def _legacy_sign_and_encode(client_secret, access_token, params):
+    """原来的请求构造：签名时排序一次、表单再排序编码一次，每次重建HMAC密钥，nonce用randint"""
+    timestamp = str(int(time.time() * 1000))
+    nonce = str(random.randint(0, 20000))
+    sorted_params = sorted((k, v) for k, v in params.items() if v is not None)
+    param_str = '&'.join(f"{k}={v}" for k, v in sorted_params)
+    base_str = f"access_token={access_token}&timestamp={timestamp}&nonce={nonce}"
+    if param_str:
+        base_str += f"&{param_str}"
+    sign = hmac.new(client_secret.encode('utf-8'), base_str.encode('utf-8'), hashlib.sha256).hexdigest()
+    form_data = urlencode(sorted(params.items(), key=lambda x: x[0]))
+    return sign, form_data
+
+
+def _signed_request_sign_and_encode(api, access_token, params):
+    """现在的请求构造：SignedRequest只排序序列化一次，HMAC密钥状态预先算好"""
+    timestamp = str(int(time.time() * 1000))
+    request = oppo_client.SignedRequest(params)
+    return api._sign(access_token, timestamp, oppo_client.new_nonce(), request.param_str), request.body
+
+
+def bench_sign(count):
+    """对比请求构造（签名+表单编码）的CPU耗时，分别用创建广告位和列表查询两种参数"""
+    api = oppo_client.OppoAdAPI("bench-client", "bench-secret-0123456789", "10000")
+    cases = {
+        "创建广告位参数": {
+            "appId": "10000", "devCrtType": "19", "posName": "应用名称-首页-激励-5-12", "posScene": 4,
+            "renderMode": 3, "targetPriceOpen": 1, "adMultiDevCrtTypes": "100,6,7,8,11,47,46", "targetPrice": 5,
+        },
+        "列表查询参数": {"page": 1, "rows": 100},
+        "带特殊字符的参数": {"appId": "10000", "posName": "x&y=1 首页", "searchingWord": "a+b%c"},
+    }
+    for name, params in cases.items():
+        # 表单体解析回来必须和签名用的参数一致，否则服务端验签失败
+        _, body = _signed_request_sign_and_encode(api, "token", params)
+        expected = {k: str(v) for k, v in params.items() if v is not None}
+        if {k: v[0] for k, v in parse_qs(body, keep_blank_values=True).items()} != expected:
+            raise AssertionError(f"{name}的表单体和签名参数不一致：{body}")
+        for title, build in (
+            ("原实现", lambda: _legacy_sign_and_encode(api.client_secret, "token", params)),
+            ("SignedRequest", lambda: _signed_request_sign_and_encode(api, "token", params)),
+        ):
+            begin = time.perf_counter()
+            for _ in range(count):
+                build()
+            elapsed = time.perf_counter() - begin
+            print(f"[bold]{name} {title}[/]: 每次{elapsed / count * 1e6:.2f}µs")
+
+
+class RequestRecorder:
+    """挂在session的response钩子上，记录每个HTTP请求的耗时"""
+
+    def __init__(self):
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def __call__(self, response, *args, **kwargs):
+        with self._lock:
+            self.latencies.append(response.elapsed.total_seconds())
+        return response
+
+    def take(self):
+        with self._lock:
+            latencies, self.latencies = self.latencies, []
+        return latencies
+
+
+def _use_app_list(app_list):
+    """把压测用的应用列表换进应用注册表"""
+    import oppo_app_registry
+    oppo_app_registry.use_apps(app_list)
+
+
+def _run_flow(title, recorder, flow):
+    """运行一个流程，屏蔽脚本自己的输出，然后打印吞吐和延迟"""
+    recorder.take()
+    begin = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        flow()
+    elapsed = time.perf_counter() - begin
+    latencies = recorder.take()
+    if latencies:
+        _report(title, latencies, elapsed)
+    print(f"  总耗时{elapsed:.2f}秒")
+
+
+def bench_creation(recorder, app_list, slots, workers):
+    """批量创建：按清单计划把slots个广告位均分到各应用"""
+    import oppo_ad_creat
+
+    rows = [
+        {"app": app_info["MEDIA_ID"], "template": 1, "base_name": "bench", "target_price": 5,
+         "count": -(-slots // len(app_list))} #向上取整，多出来的在下面截掉
+        for app_info in app_list.values()
+    ]
+    plan = oppo_ad_creat.build_plan(rows)[:slots]
+    _run_flow(f"广告创建（{len(plan)}个，{workers}并发）", recorder, lambda: oppo_ad_creat.run_plan(plan, workers))
+
+
+def bench_sweep(recorder, app_list):
+    """媒体状态：整页拉取对比逐个应用搜索"""
+    import oppo_ad_query
+
+    _run_flow(f"媒体状态整页拉取（{len(app_list)}个应用）", recorder, lambda: oppo_ad_query.media_sweep(app_list))
+
+    def search_all():
+        for app_info in app_list.values():
+            api = oppo_ad_query.OppoAdAPI(app_info["CLIENT_ID"], app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+            api.media_query(app_info["APP_NAME"])
+    _run_flow(f"媒体状态逐个搜索（{len(app_list)}个应用）", recorder, search_all)
+
+
+def bench_income(recorder, days):
+    """收入查询：范围查询对比逐天查询"""
+    import oppo_incomes_query
+
+    today = datetime.now().date()
+    start, end = today - timedelta(days=days), today - timedelta(days=1)
+    _run_flow(f"收入范围查询（{days}天）", recorder, lambda: list(oppo_incomes_query.income_range(start, end)))
+    _run_flow(f"收入逐天查询（{days}天）", recorder, lambda: [oppo_incomes_query.income(d) for d in range(days, 0, -1)])
+
+
+def bench_polling(recorder, server, app_list, hours, changes, tick=30):
+    """媒体状态轮询：固定15分钟逐个搜索、固定15分钟整页拉取、自适应间隔三种方式，用虚拟时钟跑hours小时
+
+    期间随机挑changes个应用，每个先被冻结，0.5~3小时后恢复，一共2*changes次状态变化
+    """
+    import oppo_ad_query
+
+    rng = random.Random(0)
+    flips = []
+    for app_info in rng.sample(list(app_list.values()), min(changes, len(app_list))):
+        frozen_at = rng.uniform(0, hours * 3600 * 0.8)
+        flips.append((frozen_at, app_info, 4))
+        flips.append((frozen_at + rng.uniform(1800, 3 * 3600), app_info, 2))
+    flips.sort(key=lambda flip: flip[0])
+    apps = list(app_list.values())
+
+    def simulate(title, step):
+        """step(now)返回这一刻检测到变化的应用名；统计请求数和每个变化的发现延迟"""
+        server.state.status_overrides.clear()
+        recorder.take()
+        pending = {}
+        delays = []
+        flip_iter = iter(flips)
+        next_flip = next(flip_iter, None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for now in range(0, int(hours * 3600) + 1, tick):
+                while next_flip is not None and next_flip[0] <= now:
+                    flip_at, app_info, status = next_flip
+                    server.state.set_status(app_info["MEDIA_ID"], status)
+                    pending[app_info["APP_NAME"]] = flip_at
+                    next_flip = next(flip_iter, None)
+                for name in step(now):
+                    if name in pending:
+                        delays.append(now - pending.pop(name))
+        requests_count = len(recorder.take())
+        delays.sort()
+        print(f"[bold]{title}[/]: 请求{requests_count}次，发现{len(delays)}/{len(flips)}个变化，"
+              f"平均延迟{statistics.mean(delays) if delays else 0:.0f}秒，最大{delays[-1] if delays else 0:.0f}秒")
+
+    def fixed_step(query):
+        last = {}
+        def step(now):
+            if now % 900:
+                return []
+            names = []
+            for app_info, result in zip(apps, query()):
+                if last.get(app_info["APP_NAME"], result) != result:
+                    names.append(app_info["APP_NAME"])
+                last[app_info["APP_NAME"]] = result
+            return names
+        return step
+
+    def search_all():
+        return [
+            oppo_ad_query.OppoAdAPI(app_info["CLIENT_ID"], app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+            .media_query(app_info["APP_NAME"])
+            for app_info in apps
+        ]
+    simulate(f"固定15分钟逐个搜索（{hours}小时）", fixed_step(search_all))
+    simulate(f"固定15分钟整页拉取（{hours}小时）", fixed_step(lambda: oppo_ad_query.media_sweep(app_list)))
+
+    clock = [0]
+    poller = oppo_ad_query.AdaptiveMediaPoller(app_list, clock=lambda: clock[0])
+    def adaptive_step(now):
+        clock[0] = now
+        return [app_info["APP_NAME"] for app_info, _, _ in poller.poll()]
+    simulate(f"自适应间隔（{hours}小时）", adaptive_step)
+
+
+def _naive_analytics(rows, dates, windows=(7, 30), baseline_days=7, drop_ratio=0.3, min_baseline=1.0):
+    """逐行字典循环的版本，作为向量化实现的对照；返回{名称: {应用: [每天的值]}}"""
+    series = {}
+    for row in rows:
+        day = series.setdefault(row["app_name"], {}).setdefault(row["date"], [0.0, None])
+        day[0] += float(row["income"])
+        day[1] = row["ecpm"]
+
+    nan = float("nan")
+    result = {f"rolling_{window}": {} for window in windows}
+    result.update(dod={}, ecpm_drop={})
+    for app, days in series.items():
+        income = [days[d][0] if d in days else None for d in dates]
+        ecpm = [days[d][1] if d in days else None for d in dates]
+        for window in windows:
+            means = []
+            for t in range(len(dates)):
+                values = [v for v in income[max(0, t - window + 1):t + 1] if v is not None]
+                means.append(sum(values) / len(values) if values else nan)
+            result[f"rolling_{window}"][app] = means
+        result["dod"][app] = [nan] + [
+            income[t] - income[t - 1] if income[t] is not None and income[t - 1] is not None else nan
+            for t in range(1, len(dates))
+        ]
+        drops = []
+        for t in range(len(dates)):
+            previous = [v for v in ecpm[max(0, t - baseline_days):t] if v is not None]
+            baseline = sum(previous) / len(previous) if previous else None
+            drops.append(bool(ecpm[t] is not None and baseline is not None and baseline >= min_baseline
+                              and ecpm[t] < baseline * (1 - drop_ratio)))
+        result["ecpm_drop"][app] = drops
+    return result
+
+
+def bench_analytics(apps, days):
+    """收入分析：NumPy向量化对比逐行字典循环，apps个应用×days天的模拟数据"""
+    import numpy as np
+    import oppo_income_analytics as analytics
+
+    rng = np.random.default_rng(0)
+    start = datetime(2024, 1, 1).date()
+    dates = [(start + timedelta(days=d)).strftime('%Y-%m-%d') for d in range(days)]
+    rows = []
+    for a in range(apps):
+        base_ecpm = rng.uniform(5, 50)
+        for d, day in enumerate(dates):
+            if rng.random() < 0.02: #偶尔缺一天
+                continue
+            ecpm = base_ecpm * (0.5 if rng.random() < 0.01 else rng.uniform(0.9, 1.1))
+            rows.append({"app_name": f"app-{a:04d}", "date": day,
+                         "income": round(float(rng.uniform(100, 10000)), 2), "ecpm": round(float(ecpm), 2)})
+    print(f"[bold]{apps}个应用 × {days}天，{len(rows)}行")
+
+    begin = time.perf_counter()
+    naive = _naive_analytics(rows, dates)
+    naive_elapsed = time.perf_counter() - begin
+    print(f"[bold]逐行字典循环[/]: {naive_elapsed * 1000:.0f}ms")
+
+    begin = time.perf_counter()
+    frame = analytics.IncomeFrame.from_rows(rows)
+    loaded = time.perf_counter()
+    result = analytics.analyze(frame)
+    done = time.perf_counter()
+    print(f"[bold]NumPy向量化[/]: 装载{(loaded - begin) * 1000:.0f}ms + 计算{(done - loaded) * 1000:.0f}ms，"
+          f"共{(done - begin) * 1000:.0f}ms，快{naive_elapsed / (done - begin):.1f}倍")
+
+    # 两种实现的结果应该一样
+    for name, values in naive.items():
+        expected = np.array([values[app] for app in frame.apps], dtype=float)
+        if not np.allclose(result[name].astype(float), expected, equal_nan=True):
+            print(f"[red]{name}结果不一致")
+    print(f"ecpm下跌{int(result['ecpm_drop'].sum())}次")
+
+
+def bench_suite(args):
+    """启动本地模拟服务（或使用--url指定的服务），依次压测创建、媒体状态、收入三个流程"""
+    from oppo_fake_server import FakeConfig, FakeServer, bench_app_list
+
+    server = None
+    url = args.url
+    if args.command == "polling" and url:
+        print("[red]polling需要在进程内启动模拟服务，不能用--url")
+        return
+    if not url:
+        config = FakeConfig(
+            latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+            rate_limit=args.rate_limit, apps_per_company=args.apps, frozen_every=getattr(args, "frozen_every", 7)
+        )
+        server = FakeServer(config)
+        url = server.start()
+    oppo_client.API_DOMAIN = url
+
+    # token缓存写到临时目录，不影响真实的缓存
+    with tempfile.TemporaryDirectory() as tmp:
+        oppo_client.token_store.TOKEN_STORE_PATH = os.path.join(tmp, "tokens.json")
+
+        recorder = RequestRecorder()
+        oppo_client.get_session(url).hooks["response"].append(recorder)
+
+        app_list = bench_app_list(args.companies, args.apps)
+        _use_app_list(app_list)
+        print(f"[bold]模拟服务{url}，{args.companies}个主体 × {args.apps}个应用，"
+              f"延迟{args.latency}±{args.jitter}ms，错误率{args.error_rate}，限流{args.rate_limit or '无'}")
+
+        if args.command in ("creation", "suite"):
+            bench_creation(recorder, app_list, args.slots, args.workers)
+        if args.command in ("sweep", "suite"):
+            bench_sweep(recorder, app_list)
+        if args.command in ("income", "suite"):
+            bench_income(recorder, args.days)
+        if args.command == "polling":
+            bench_polling(recorder, server, app_list, args.hours, args.changes)
+        if args.profile:
+            oppo_metrics.profile_report()
+
+    if server is not None:
+        print(f"服务端统计：{server.state.stats}")
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="oppo联盟脚本性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_client = sub.add_parser("client", help="对比连接池前后的单次请求耗时")
+    p_client.add_argument("--url", default=f"{oppo_client.API_DOMAIN}/oauth2/v1/token", help="请求的地址")
+    p_client.add_argument("-n", "--count", type=int, default=50, help="每种方式的请求次数")
+
+    p_sign = sub.add_parser("sign", help="对比请求构造（签名+表单编码）的CPU耗时")
+    p_sign.add_argument("-n", "--count", type=int, default=100000, help="每种方式的次数")
+
+    p_analytics = sub.add_parser("analytics", help="对比收入分析的向量化实现和逐行循环")
+    p_analytics.add_argument("--apps", type=int, default=300, help="应用数")
+    p_analytics.add_argument("--days", type=int, default=365, help="天数")
+
+    for name, help_text in (
+        ("suite", "依次压测创建、媒体状态、收入"),
+        ("creation", "压测批量创建广告位"),
+        ("sweep", "压测媒体状态查询"),
+        ("income", "压测收入查询"),
+        ("polling", "对比固定周期和自适应间隔的媒体状态轮询（虚拟时钟）"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--url", help="已启动的模拟服务地址，不填则在进程内启动一个")
+        p.add_argument("--companies", type=int, default=3, help="主体数")
+        p.add_argument("--apps", type=int, default=20, help="每个主体的应用数")
+        p.add_argument("--slots", type=int, default=200, help="创建的广告位总数")
+        p.add_argument("--workers", type=int, default=16, help="创建时的并发数")
+        p.add_argument("--days", type=int, default=30, help="收入查询的天数")
+        p.add_argument("--latency", type=float, default=30, help="模拟服务每个请求的延迟（毫秒）")
+        p.add_argument("--jitter", type=float, default=20, help="模拟服务随机增加的延迟上限（毫秒）")
+        p.add_argument("--error-rate", type=float, default=0, help="模拟服务的错误率")
+        p.add_argument("--rate-limit", type=float, default=0, help="模拟服务每个主体每秒允许的请求数")
+        p.add_argument("--profile", action="store_true", help="最后打印请求各阶段的耗时分解")
+        if name == "polling":
+            p.add_argument("--hours", type=float, default=24, help="模拟运行的小时数")
+            p.add_argument("--changes", type=int, default=10, help="期间被冻结又恢复的应用数")
+            p.add_argument("--frozen-every", type=int, default=0, help="开始时每隔几个应用有一个是冻结状态，0表示全部正常")
+
+    args = parser.parse_args()
+
+    if args.command == "client":
+        bench_client(args.url, args.count)
+    elif args.command == "sign":
+        bench_sign(args.count)
+    elif args.command == "analytics":
+        bench_analytics(args.apps, args.days)
+    else:
+        bench_suite(args)
+
+
+if __name__ == "__main__":
+    main()
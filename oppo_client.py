@@ -0,0 +1,572 @@
+# oppo联盟开放平台公共客户端：连接池、签名、请求都在这里，三个脚本共用
+
+import hmac
+import hashlib
+import os
+import random
+import secrets
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urlencode, urlsplit
+
+import requests # type: ignore
+from requests.adapters import HTTPAdapter # type: ignore
+from rich import print
+
+import oppo_token_store as token_store
+from oppo_metrics import METRICS
+
+# 接口域名，可以用环境变量OPPO_API_DOMAIN指到本地的模拟服务（oppo_fake_server.py）
+API_DOMAIN = os.environ.get("OPPO_API_DOMAIN", "https://openapi.heytapmobi.com")
+
+# 连接池参数：批量创建、并发查询时可以调大POOL_MAXSIZE
+POOL_CONNECTIONS = 4 #每个session缓存的host连接池个数
+POOL_MAXSIZE = 32 #每个host最多保持的长连接数
+REQUEST_TIMEOUT = 15 #普通接口的超时秒数
+TOKEN_TIMEOUT = 10 #获取token的超时秒数
+TOKEN_REFRESH_AHEAD = 600 #后台刷新在token过期前多少秒续期
+
+# 限速参数：每个主体每个接口(初始速率, 速率上限)，单位次/秒；被限流后减半，成功后逐步涨回上限
+RATE_LIMITS = {
+    "/union/v1/order/create": (5, 20),
+    "/union/v1/app/list": (5, 20),
+    "/union/api/report/appQuery": (2, 10),
+}
+DEFAULT_RATE_LIMIT = (5, 20)
+RATE_MIN = 0.2 #速率下限
+RATE_INCREASE = 0.02 #每次成功增加上限的这个比例
+THROTTLE_RETRIES = 3 #被限流后最多重试的次数
+THROTTLE_BACKOFF_BASE = 1 #第一次被限流后暂停的秒数，连续限流时翻倍
+THROTTLE_BACKOFF_MAX = 60 #暂停秒数上限
+THROTTLE_CODES = set() #平台表示限流的业务错误码，确认后加进来
+TOKEN_INVALID_CODES = {401} #平台表示access_token无效的业务错误码；HTTP 401也按token无效处理
+THROTTLE_KEYWORDS = ("频繁", "限流", "too many", "rate limit") #错误信息里出现这些词也按限流处理
+
+# 熔断参数：同一主体同一接口连续失败（网络错误、token获取失败、HTTP 401/5xx）达到次数后，冷却期内直接返回失败不再请求
+# 参数错误之类的业务错误码只和单个请求有关，不算失败
+# 冷却结束后放一个请求试探，成功就恢复，失败就再次熔断且冷却时间翻倍
+BREAKER_FAILURES = 5 #连续失败多少次后熔断
+BREAKER_COOLDOWN = 60 #第一次熔断的冷却秒数
+BREAKER_COOLDOWN_MAX = 900 #冷却秒数上限
+BREAKER_CODES = set() #平台表示服务异常的业务错误码，确认后加进来，也算作失败
+
+UNSENT_ERRORS = ("circuit_open", "token", "http_429") #这些错误说明请求没有发出或者被平台直接拒绝，肯定没有执行
+
+
+_sessions = {} #按host保存session，同一进程内复用长连接
+_sessions_lock = threading.Lock()
+
+_tokens = {} #按CLIENT_ID保存token：(access_token, 过期时间戳)，同一进程内所有实例共用
+_credentials = {} #按CLIENT_ID保存CLIENT_SECRET，给后台刷新用
+_token_locks = {}
+_token_locks_guard = threading.Lock()
+_refresher = None
+
+first_request_at = None #本进程第一个请求发出的时间(perf_counter)，选择器用来统计启动到第一个请求的耗时
+
+_limiters = {} #按(CLIENT_ID, 接口)保存限速器
+_limiters_lock = threading.Lock()
+
+_breakers = {} #按(CLIENT_ID, 接口)保存熔断器
+
+
+def configure_pool(pool_connections=None, pool_maxsize=None):
+    """调整连接池大小，已建立的session会被关闭，下次请求时按新参数重建"""
+    global POOL_CONNECTIONS, POOL_MAXSIZE
+    if pool_connections is not None:
+        POOL_CONNECTIONS = pool_connections
+    if pool_maxsize is not None:
+        POOL_MAXSIZE = pool_maxsize
+    close_sessions()
+
+
+def get_session(url):
+    """按host获取带连接池的session，没有就新建一个"""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            session.mount(host, adapter)
+            session.headers.update({"Connection": "keep-alive"})
+            _sessions[host] = session
+        return session
+
+
+def close_sessions():
+    """关闭所有session，释放长连接"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _token_lock(client_id):
+    """每个主体一把锁，保证同一时间只有一个线程在请求它的token"""
+    with _token_locks_guard:
+        lock = _token_locks.get(client_id)
+        if lock is None:
+            lock = _token_locks[client_id] = threading.Lock()
+        return lock
+
+
+def _mark_request():
+    """记录第一个请求的时间"""
+    global first_request_at
+    if first_request_at is None:
+        first_request_at = time.perf_counter()
+
+
+def _fetch_token(client_id, client_secret):
+    """请求/oauth2/v1/token，返回(access_token, 过期时间戳)，失败时抛出异常"""
+    _mark_request()
+    path = "/oauth2/v1/token"
+    url = f"{API_DOMAIN}{path}"
+    params = {
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "grant_type": "client_credentials"
+    }
+
+    begin = time.perf_counter()
+    try:
+        response = get_session(url).get(url, params=params, timeout=TOKEN_TIMEOUT)
+        METRICS.observe("oppo_api_phase_seconds", time.perf_counter() - begin, endpoint=path, phase="http")
+        response.raise_for_status()
+        parse_begin = time.perf_counter()
+        result = response.json()
+        METRICS.observe("oppo_api_phase_seconds", time.perf_counter() - parse_begin, endpoint=path, phase="parse")
+    except requests.exceptions.RequestException as e:
+        METRICS.inc("oppo_api_errors_total", endpoint=path, kind=_error_kind(e))
+        METRICS.inc("oppo_api_requests_total", endpoint=path, code="-1")
+        raise
+    finally:
+        METRICS.observe("oppo_api_request_seconds", time.perf_counter() - begin, endpoint=path)
+    METRICS.inc("oppo_api_requests_total", endpoint=path, code=str(result.get("code")))
+
+    if result.get("code") == 0:
+        return result["data"]["access_token"], time.time() + result["data"]["expire_in"] - 300
+    else:
+        raise Exception(f"获取token失败: {result.get('message')}")
+
+
+def obtain_token(client_id, client_secret, min_valid=0):
+    """取一个剩余有效期大于min_valid秒的token，返回(access_token, 过期时间戳)
+
+    并发调用时同一主体只会有一个线程去请求，其余线程等它的结果；失败时抛出异常
+    """
+    _credentials[client_id] = client_secret #记下来给后台刷新用
+
+    cached = _tokens.get(client_id)
+    if cached and cached[1] - time.time() > min_valid:
+        return cached
+
+    with _token_lock(client_id):
+        # 等锁的时候可能已经有别的线程取到了
+        cached = _tokens.get(client_id)
+        if cached and cached[1] - time.time() > min_valid:
+            return cached
+
+        # 其他脚本或进程已经取过的token，直接从磁盘缓存拿
+        try:
+            cached = token_store.load_token(client_id)
+        except OSError: #缓存文件读不了就当没有，直接去请求
+            cached = None
+        if cached and cached[1] - time.time() > min_valid:
+            _tokens[client_id] = cached
+            return cached
+
+        token = _fetch_token(client_id, client_secret)
+        _tokens[client_id] = token
+        try:
+            token_store.save_token(client_id, *token)
+        except OSError as e:
+            print(f"[yellow]token缓存写入失败: {e}")
+        return token
+
+
+def invalidate_token(client_id, access_token):
+    """token被平台判定无效时，从内存和磁盘缓存里删掉；已经换成新token的不动"""
+    with _token_lock(client_id):
+        cached = _tokens.get(client_id)
+        if cached and cached[0] == access_token:
+            del _tokens[client_id]
+        try:
+            token_store.clear_token(client_id, access_token=access_token)
+        except OSError as e:
+            print(f"[yellow]token缓存清理失败: {e}")
+
+
+def _is_token_invalid(result):
+    """接口返回的是不是token无效"""
+    return result.get("error") == "http_401" or result.get("code") in TOKEN_INVALID_CODES
+
+
+def refresh_due_tokens():
+    """续期所有快过期的token，单个主体失败不影响其他主体"""
+    for client_id, client_secret in list(_credentials.items()):
+        try:
+            obtain_token(client_id, client_secret, min_valid=TOKEN_REFRESH_AHEAD)
+        except Exception as e:
+            print(f"[red bold]后台刷新access_token出错({client_id}): {str(e)}")
+
+
+class TokenRefresher(threading.Thread):
+    """后台线程：在token过期前TOKEN_REFRESH_AHEAD秒提前续期，请求路径上就不用等token"""
+
+    def __init__(self, interval=60):
+        super().__init__(name="oppo-token-refresher", daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.refresh_due()
+
+    def refresh_due(self):
+        refresh_due_tokens()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_token_refresher(interval=60):
+    """启动后台token刷新线程，重复调用只会启动一个"""
+    global _refresher
+    with _token_locks_guard:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = TokenRefresher(interval)
+            _refresher.start()
+        return _refresher
+
+
+def _error_kind(e):
+    """请求异常的分类，HTTP错误用状态码，其他用异常类名"""
+    response = getattr(e, "response", None)
+    if response is not None:
+        return f"http_{response.status_code}"
+    return type(e).__name__
+
+
+def _retry_after(response):
+    """读取Retry-After响应头（秒），没有或格式不对时返回0"""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", 0)))
+    except ValueError:
+        return 0.0
+
+
+def _is_throttled(result):
+    """接口返回的是不是限流错误"""
+    if result.get("code") in (0, None):
+        return False
+    if result.get("code") in THROTTLE_CODES:
+        return True
+    message = str(result.get("message") or "").lower()
+    return any(keyword in message for keyword in THROTTLE_KEYWORDS)
+
+
+class RateLimiter:
+    """令牌桶限速：被限流时速率减半并暂停一段时间（指数退避加抖动），之后每次成功慢慢加回来"""
+
+    def __init__(self, rate, max_rate, min_rate=RATE_MIN):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0 #连续被限流的次数
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """拿到一个令牌才返回，桶空或在暂停期内就等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.throttled = 0
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_INCREASE)
+
+    def on_throttle(self, retry_after=0):
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            backoff = min(THROTTLE_BACKOFF_MAX, THROTTLE_BACKOFF_BASE * 2 ** (self.throttled - 1))
+            pause = max(retry_after, backoff * random.uniform(0.5, 1))
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+
+
+class CircuitBreaker:
+    """熔断器：closed正常放行；open冷却中直接失败；冷却结束后half_open只放一个试探请求"""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, cooldown_max=BREAKER_COOLDOWN_MAX):
+        self.max_failures = failures
+        self.base_cooldown = cooldown
+        self.cooldown_max = cooldown_max
+        self.state = "closed"
+        self.failures = 0 #连续失败次数
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """这次能不能发请求；冷却结束后第一个调用的线程去试探，其余的继续直接失败"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() >= self.open_until:
+                self.state = "half_open"
+                return True
+            return False
+
+    def on_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+
+    def on_failure(self, message=None):
+        """记录一次失败，返回这次是否触发了熔断"""
+        with self._lock:
+            self.last_error = message
+            self.failures += 1
+            if self.state == "half_open": #试探失败，冷却时间翻倍
+                self.cooldown = min(self.cooldown_max, self.cooldown * 2)
+            elif self.failures < self.max_failures:
+                return False
+            self.state = "open"
+            self.open_until = time.monotonic() + self.cooldown
+            return True
+
+    def release(self):
+        """试探请求没有结果（一直被限流），回到open，过一个冷却期再试探，冷却时间不变"""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.open_until = time.monotonic() + self.cooldown
+
+    def retry_in(self):
+        """还要多少秒才会放试探请求"""
+        return max(0.0, self.open_until - time.monotonic()) if self.state == "open" else 0.0
+
+
+def _is_failure(result):
+    """请求结果是否算作熔断的失败：网络错误、token获取失败、HTTP 401/5xx，或者是BREAKER_CODES里的错误码"""
+    error = result.get("error")
+    if error:
+        return error == "http_401" or not error.startswith("http_4")
+    return result.get("code") in BREAKER_CODES
+
+
+def not_sent(result):
+    """请求肯定没有执行（熔断中、没拿到token、被限流到重试用完），可以直接当作失败，不用去平台核对"""
+    return result.get("error") in UNSENT_ERRORS
+
+
+def get_circuit_breaker(client_id, path):
+    """按主体和接口取熔断器，同一进程内共用"""
+    key = (client_id, path)
+    with _limiters_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker()
+        return breaker
+
+
+def open_circuits():
+    """当前处于熔断状态的[(CLIENT_ID, 接口, 剩余冷却秒数, 最后的错误)]"""
+    with _limiters_lock:
+        items = list(_breakers.items())
+    return [
+        (client_id, path, breaker.retry_in(), breaker.last_error)
+        for (client_id, path), breaker in items if breaker.state != "closed"
+    ]
+
+
+def get_rate_limiter(client_id, path):
+    """按主体和接口取限速器，同一进程内共用"""
+    key = (client_id, path)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            rate, max_rate = RATE_LIMITS.get(path, DEFAULT_RATE_LIMIT)
+            limiter = _limiters[key] = RateLimiter(rate, max_rate)
+        return limiter
+
+
+class SignedRequest:
+    """一次请求的参数：排序、转字符串只做一次，签名用的参数串和表单体都从这里取"""
+    __slots__ = ("param_str", "body")
+
+    def __init__(self, params):
+        pairs = sorted((k, str(v)) for k, v in params.items() if v is not None)
+        self.param_str = '&'.join(f"{k}={v}" for k, v in pairs)
+        self.body = urlencode(pairs) #和签名用同一份排好序的参数
+
+
+@lru_cache(maxsize=None)
+def _hmac_state(client_secret):
+    """按CLIENT_SECRET缓存已经装好密钥的HMAC对象，签名时copy一份再update"""
+    return hmac.new(client_secret.encode('utf-8'), digestmod=hashlib.sha256)
+
+
+def new_nonce():
+    """随机nonce：62位的系统随机数，高并发下也不会重复（原来0~20000的随机数很容易撞）"""
+    return str(secrets.randbits(62))
+
+
+class OppoAdAPI:
+    def __init__(self, client_id, client_secret, media_id):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.media_id = media_id
+        self.access_token = None
+        self.token_expire_time = 0
+
+    def _generate_signature(self, access_token, timestamp, nonce, params):
+        """签名生成算法"""
+        return self._sign(access_token, timestamp, nonce, SignedRequest(params).param_str)
+
+    def _sign(self, access_token, timestamp, nonce, param_str):
+        """用已经拼好的参数串签名，HMAC的密钥状态按CLIENT_SECRET预先算好，每次只复制一份"""
+        base_str = f"access_token={access_token}&timestamp={timestamp}&nonce={nonce}"
+        if param_str:
+            base_str += f"&{param_str}"
+        mac = _hmac_state(self.client_secret).copy()
+        mac.update(base_str.encode('utf-8'))
+        return mac.hexdigest()
+
+    def get_access_token(self):
+        """获取access_token"""
+        # 同一主体的所有实例共用一个token，后台刷新后这里也能直接拿到新的
+        cached = _tokens.get(self.client_id)
+        if cached and time.time() < cached[1]:
+            self.access_token, self.token_expire_time = cached
+            return self.access_token
+
+        try:
+            self.access_token, self.token_expire_time = obtain_token(self.client_id, self.client_secret)
+            return self.access_token
+        except Exception as e:
+            print(f"[red bold]获取access_token出错: {str(e)}")
+            return None
+
+    def _post(self, path, params, timeout=REQUEST_TIMEOUT):
+        """统一的签名+POST请求，按主体和接口限速、熔断，被限流时退避重试；返回接口的json，出错时返回code为-1的字典
+
+        出错时字典里的error是错误类型（token、http_状态码、异常类名）；熔断中直接返回error为circuit_open的字典，不发请求
+        """
+        begin = time.perf_counter()
+        breaker = get_circuit_breaker(self.client_id, path)
+        if not breaker.allow():
+            METRICS.inc("oppo_api_errors_total", endpoint=path, kind="circuit_open")
+            return {
+                "code": -1, "error": "circuit_open",
+                "message": f"连续失败已熔断，{breaker.retry_in():.0f}秒后重试（最后的错误：{breaker.last_error}）",
+            }
+
+        limiter = get_rate_limiter(self.client_id, path)
+        request = SignedRequest(params) #重试时参数不变，只排序、序列化一次
+        try:
+            for attempt in range(THROTTLE_RETRIES + 1):
+                wait_begin = time.perf_counter()
+                limiter.acquire()
+                METRICS.observe("oppo_api_phase_seconds", time.perf_counter() - wait_begin, endpoint=path, phase="rate_limit")
+                result, retry_after = self._send(path, request, timeout)
+                METRICS.inc("oppo_api_requests_total", endpoint=path, code=str(result.get("code")))
+                if retry_after is None:
+                    limiter.on_success()
+                    if not _is_failure(result):
+                        breaker.on_success()
+                    elif breaker.on_failure(result.get("message")):
+                        METRICS.inc("oppo_api_circuit_open_total", endpoint=path)
+                        print(f"[red bold]{self.client_id} {path} 连续失败，熔断{breaker.cooldown:.0f}秒")
+                    return result
+                METRICS.inc("oppo_api_retries_total", endpoint=path, reason="throttled")
+                limiter.on_throttle(retry_after) #降速并暂停，下一轮acquire会等到暂停结束
+            breaker.release() #重试次数用完还是被限流，不算熔断的失败；如果是试探请求，下个冷却期再试
+            return result
+        finally:
+            METRICS.observe("oppo_api_request_seconds", time.perf_counter() - begin, endpoint=path)
+
+    def _send(self, path, request, timeout):
+        """签名并发送一次请求（request是SignedRequest），返回(json, retry_after)；没有被限流时retry_after为None
+
+        token被平台判定无效时，丢掉这个token，换一个新token再发一次
+        """
+        for attempt in range(2):
+            begin = time.perf_counter()
+            access_token = self.get_access_token()
+            signed_at = time.perf_counter()
+            METRICS.observe("oppo_api_phase_seconds", signed_at - begin, endpoint=path, phase="token")
+            if not access_token:
+                METRICS.inc("oppo_api_errors_total", endpoint=path, kind="token")
+                return {"code": -1, "error": "token", "message": "获取access_token失败"}, None
+
+            result, retry_after = self._send_signed(path, request, timeout, access_token, signed_at)
+            if attempt or not _is_token_invalid(result):
+                return result, retry_after
+            METRICS.inc("oppo_api_retries_total", endpoint=path, reason="token_invalid")
+            invalidate_token(self.client_id, access_token)
+            self.access_token = None
+
+    def _send_signed(self, path, request, timeout, access_token, signed_at):
+        """用access_token签名并发送，返回(json, retry_after)"""
+        _mark_request()
+        url = f"{API_DOMAIN}{path}"
+        timestamp = str(int(time.time() * 1000))
+        nonce = new_nonce()
+        sign = self._sign(access_token, timestamp, nonce, request.param_str)
+
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Authorization": f"{access_token}",
+            "X-Client-Send-Utc-Ms": timestamp,
+            "X-Nonce": nonce,
+            "X-Api-Sign": sign
+        }
+
+        sent_at = time.perf_counter()
+        METRICS.observe("oppo_api_phase_seconds", sent_at - signed_at, endpoint=path, phase="sign")
+        try:
+            response = get_session(url).post(
+                url,
+                headers=headers,
+                data=request.body,
+                timeout=timeout
+            )
+            received_at = time.perf_counter()
+            METRICS.observe("oppo_api_phase_seconds", received_at - sent_at, endpoint=path, phase="http")
+            if response.status_code == 429:
+                METRICS.inc("oppo_api_errors_total", endpoint=path, kind="http_429")
+                return {"code": -1, "error": "http_429", "message": "请求被限流(HTTP 429)"}, _retry_after(response)
+            response.raise_for_status()
+            result = response.json()
+            METRICS.observe("oppo_api_phase_seconds", time.perf_counter() - received_at, endpoint=path, phase="parse")
+            if _is_throttled(result):
+                return result, 0
+            return result, None
+        except requests.exceptions.RequestException as e:
+            kind = _error_kind(e)
+            METRICS.inc("oppo_api_errors_total", endpoint=path, kind=kind)
+            return {"code": -1, "error": kind, "message": str(e)}, None
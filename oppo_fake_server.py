@@ -0,0 +1,313 @@
+# 本地模拟的oppo联盟开放平台，用来离线测试和压测，不会碰到真实接口
+# 用法：python oppo_fake_server.py --port 8765 --latency 50 --error-rate 0.01 --rate-limit 20
+#       然后 OPPO_API_DOMAIN=http://127.0.0.1:8765 python oppo_ad_query.py
+# 签名按oppo_client里_generate_signature的算法逐字节校验；主体的CLIENT_SECRET以第一次取token时传的为准
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeConfig:
+    """模拟服务的行为参数"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=0.0, apps_per_company=10,
+                 token_expire=86400, frozen_every=7, seed=None):
+        self.latency = latency #每个请求固定增加的延迟（秒）
+        self.jitter = jitter #在固定延迟上随机增加0~jitter秒
+        self.error_rate = error_rate #随机返回系统错误的比例
+        self.rate_limit = rate_limit #每个主体每秒允许的请求数，0表示不限
+        self.apps_per_company = apps_per_company #每个主体下的应用数
+        self.token_expire = token_expire #token有效期（秒）
+        self.frozen_every = frozen_every #每隔几个应用有一个是冻结状态，0表示没有
+        self.random = random.Random(seed)
+
+
+def bench_app_list(companies, apps_per_company):
+    """生成和模拟服务数据一致的APP_LIST，压测时用"""
+    app_list = {}
+    for c in range(companies):
+        for a in range(apps_per_company):
+            app_list[len(app_list) + 1] = {
+                'APP_NAME': f"bench-app-{c}-{a}",
+                'CLIENT_ID': f"bench-client-{c}",
+                'CLIENT_SECRET': f"bench-secret-{c}",
+                'MEDIA_ID': f"{c}{a:04d}",
+                'COMPANY': f"bench-company-{c}",
+            }
+    return app_list
+
+
+class FakeState:
+    """服务端状态：token、广告位、限流桶和请求计数"""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.tokens = {} #access_token -> (client_id, client_secret, 过期时间)
+        self.slots = {} #client_id -> [(posId, appId, posName)]
+        self.buckets = {} #client_id -> [令牌数, 更新时间]
+        self.next_pos_id = 100000
+        self.status_overrides = {} #appId -> unionStatus，用来模拟状态变化
+        self.stats = {"requests": 0, "sign_errors": 0, "throttled": 0, "errors": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def company_index(self, client_id):
+        return client_id.rsplit('-', 1)[-1]
+
+    def apps(self, client_id):
+        """主体下的应用，命名规则和bench_app_list一致"""
+        c = self.company_index(client_id)
+        frozen_every = self.config.frozen_every
+        return [
+            {
+                "appId": f"{c}{a:04d}",
+                "mediaName": f"bench-app-{c}-{a}",
+                "unionStatus": self.status_overrides.get(
+                    f"{c}{a:04d}", 4 if frozen_every and a % frozen_every == frozen_every - 1 else 2
+                ),
+            }
+            for a in range(self.config.apps_per_company)
+        ]
+
+    def set_status(self, app_id, status):
+        with self.lock:
+            self.status_overrides[app_id] = status
+
+    def allow(self, client_id):
+        """按主体做令牌桶限流"""
+        rate = self.config.rate_limit
+        if not rate:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            bucket = self.buckets.setdefault(client_id, [rate, now])
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+            return False
+
+
+def expected_signature(client_secret, access_token, timestamp, nonce, params):
+    """和oppo_client.OppoAdAPI._generate_signature一样的算法"""
+    sorted_params = sorted((k, v) for k, v in params.items() if v is not None)
+    param_str = '&'.join(f"{k}={v}" for k, v in sorted_params)
+    base_str = f"access_token={access_token}&timestamp={timestamp}&nonce={nonce}"
+    if param_str:
+        base_str += f"&{param_str}"
+    return hmac.new(client_secret.encode('utf-8'), base_str.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" #支持长连接
+    wbufsize = -1 #响应头和响应体合成一次写出，避免小包触发延迟确认
+    disable_nagle_algorithm = True
+    state = None #由FakeServer设置
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, obj, status=200, headers=None):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self):
+        config = self.state.config
+        delay = config.latency + (config.random.uniform(0, config.jitter) if config.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def do_GET(self):
+        self.state.count("requests")
+        parts = urlsplit(self.path)
+        if parts.path != "/oauth2/v1/token":
+            return self._send({"code": 404, "message": "not found"}, 404)
+
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        self._delay()
+        if query.get("grant_type") != "client_credentials" or not query.get("client_id") or not query.get("client_secret"):
+            return self._send({"code": 400, "message": "参数错误"})
+
+        access_token = f"fake-{uuid.uuid4().hex}"
+        expire_in = self.state.config.token_expire
+        with self.state.lock:
+            self.state.tokens[access_token] = (query["client_id"], query["client_secret"], time.time() + expire_in)
+        self._send({"code": 0, "data": {"access_token": access_token, "expire_in": expire_in}})
+
+    def do_POST(self):
+        state = self.state
+        state.count("requests")
+        length = int(self.headers.get("Content-Length", 0))
+        params = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode('utf-8'), keep_blank_values=True).items()}
+
+        access_token = self.headers.get("Authorization", "")
+        token = state.tokens.get(access_token)
+        if token is None or time.time() > token[2]:
+            return self._send({"code": 401, "message": "access_token无效"})
+        client_id, client_secret, _ = token
+
+        sign = expected_signature(
+            client_secret, access_token,
+            self.headers.get("X-Client-Send-Utc-Ms", ""), self.headers.get("X-Nonce", ""), params
+        )
+        if not hmac.compare_digest(sign, self.headers.get("X-Api-Sign", "")):
+            state.count("sign_errors")
+            return self._send({"code": 402, "message": "签名错误"})
+
+        if not state.allow(client_id):
+            state.count("throttled")
+            return self._send({"code": 429, "message": "请求过于频繁"}, 429, {"Retry-After": "1"})
+
+        self._delay()
+        if state.config.error_rate and state.config.random.random() < state.config.error_rate:
+            state.count("errors")
+            return self._send({"code": 500, "message": "系统繁忙"})
+
+        handler = {
+            "/union/v1/order/create": self._order_create,
+            "/union/v1/app/list": self._app_list,
+            "/union/v1/pos/list": self._pos_list,
+            "/union/api/report/appQuery": self._app_query,
+        }.get(urlsplit(self.path).path)
+        if handler is None:
+            return self._send({"code": 404, "message": "not found"}, 404)
+        self._send(handler(client_id, params))
+
+    def _order_create(self, client_id, params):
+        if not params.get("appId") or not params.get("posName"):
+            return {"code": 400, "message": "缺少参数"}
+        with self.state.lock:
+            pos_id = self.state.next_pos_id
+            self.state.next_pos_id += 1
+            self.state.slots.setdefault(client_id, []).append((pos_id, params["appId"], params["posName"]))
+        return {"code": 0, "data": {"posId": pos_id}}
+
+    def _page(self, items, params):
+        page = int(params.get("page", 1))
+        rows = int(params.get("rows", 10))
+        return {"code": 0, "data": {"total": len(items), "items": items[(page - 1) * rows:page * rows]}}
+
+    def _app_list(self, client_id, params):
+        items = self.state.apps(client_id)
+        word = params.get("searchingWord")
+        if word:
+            items = [item for item in items if word in item["mediaName"]]
+        return self._page(items, params)
+
+    def _pos_list(self, client_id, params):
+        with self.state.lock:
+            slots = list(self.state.slots.get(client_id, []))
+        items = [
+            {"posId": pos_id, "posName": pos_name}
+            for pos_id, app_id, pos_name in reversed(slots) #按创建时间倒序
+            if app_id == params.get("appId") and params.get("searchingWord", "") in pos_name
+        ]
+        return self._page(items, params)
+
+    def _app_query(self, client_id, params):
+        try:
+            start = datetime.strptime(params["startTime"], "%Y%m%d")
+            end = datetime.strptime(params["endTime"], "%Y%m%d")
+        except (KeyError, ValueError):
+            return {"code": 400, "message": "时间参数错误"}
+
+        hourly = params.get("timeGranularity") == "hour"
+        now = datetime.now()
+        rows = []
+        day = start
+        while day <= end:
+            # 按小时查询时，今天只返回到当前小时（当前小时的数据还在增长）
+            hours = range(now.hour + 1 if day.date() == now.date() else 24) if hourly else [None]
+            for item in self.state.apps(client_id):
+                for bidding_type in (1, 2):
+                    for hour in hours:
+                        seed = f"{item['appId']}{day:%Y%m%d}{bidding_type}" + ("" if hour is None else f"{hour:02d}")
+                        value = int(hashlib.md5(seed.encode()).hexdigest()[:6], 16) / 1000
+                        if hour is not None:
+                            value /= 24
+                            if day.date() == now.date() and hour == now.hour:
+                                value *= (now.minute + 1) / 60
+                        row = {
+                            "date": day.strftime("%Y-%m-%d"),
+                            "appId": item["appId"],
+                            "appName": item["mediaName"],
+                            "biddingType": bidding_type,
+                            "income": round(value, 2),
+                            "ecpm": round(value % 50, 2),
+                        }
+                        if hour is not None:
+                            row["hour"] = hour
+                        rows.append(row)
+            day += timedelta(days=1)
+        return {"code": 0, "data": rows}
+
+
+class FakeServer:
+    """在后台线程运行的模拟服务，start()返回可以直接作为API_DOMAIN的地址"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.state = FakeState(config or FakeConfig())
+        handler = type("BoundFakeHandler", (FakeHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="oppo-fake-server", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的oppo联盟开放平台")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="每个请求的固定延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="随机增加的延迟上限（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="随机返回系统错误的比例，0~1")
+    parser.add_argument("--rate-limit", type=float, default=0, help="每个主体每秒允许的请求数，0不限")
+    parser.add_argument("--apps-per-company", type=int, default=10, help="每个主体下的应用数")
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+        rate_limit=args.rate_limit, apps_per_company=args.apps_per_company
+    )
+    server = FakeServer(config, args.host, args.port)
+    print(f"模拟服务已启动：{server.url}，设置 OPPO_API_DOMAIN={server.url} 后运行脚本即可")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# 收入分析：把报表行装进(应用 × 日期)的NumPy数组，向量化计算7/30天滚动均值、环比和ecpm下跌
+# 数据来自oppo_income_store的本地库，先运行 python oppo_income_store.py sync --days 60
+# 用法：python oppo_income_analytics.py [--days 60] [--app 应用名] [--drops]
+# 需要安装numpy
+
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+from rich import print
+
+ROLLING_WINDOWS = (7, 30) #滚动均值的天数
+ECPM_BASELINE_DAYS = 7 #ecpm和之前这么多天的均值比较
+ECPM_DROP_RATIO = 0.3 #比均值低30%以上算下跌
+ECPM_MIN_BASELINE = 1.0 #均值低于这个数不判断，避免数值太小时的抖动误报
+
+
+class IncomeFrame:
+    """apps × dates的收入和ecpm矩阵，没有数据的格子是NaN；dates是start起连续的每一天"""
+
+    def __init__(self, apps, start, income, ecpm):
+        self.apps = apps #应用名数组，行号就是应用下标
+        self.start = start #numpy.datetime64[D]，第0列的日期
+        self.income = income
+        self.ecpm = ecpm
+
+    @property
+    def dates(self):
+        return self.start + np.arange(self.income.shape[1])
+
+    @classmethod
+    def from_columns(cls, app_names, dates, incomes, ecpms, start=None, end=None):
+        """从等长的四列建矩阵；start/end不填时取数据里的最早和最晚日期"""
+        # 应用名先用字典编号（比np.unique排序字符串快得多），再换成按名称排序的下标
+        codes = {}
+        app_codes = np.fromiter((codes.setdefault(name, len(codes)) for name in app_names), dtype=np.intp, count=len(app_names))
+        apps = np.array(sorted(codes), dtype=object)
+        remap = np.empty(len(codes), dtype=np.intp)
+        remap[[codes[name] for name in apps]] = np.arange(len(apps))
+        app_idx = remap[app_codes]
+        days = np.asarray(dates, dtype="datetime64[D]")
+        start = np.datetime64(start, "D") if start is not None else days.min()
+        end = np.datetime64(end, "D") if end is not None else days.max()
+        n_days = int((end - start).astype(int)) + 1
+
+        date_idx = (days - start).astype(int)
+        keep = (date_idx >= 0) & (date_idx < n_days)
+        app_idx, date_idx = app_idx[keep], date_idx[keep]
+        incomes = np.asarray(incomes, dtype=float)[keep]
+        ecpms = np.asarray([np.nan if e is None else e for e in ecpms], dtype=float)[keep]
+
+        # 同一个格子有多行时收入相加，ecpm取最后一行
+        income = np.zeros((len(apps), n_days))
+        np.add.at(income, (app_idx, date_idx), incomes)
+        has_data = np.zeros((len(apps), n_days), dtype=bool)
+        has_data[app_idx, date_idx] = True
+        income[~has_data] = np.nan
+        ecpm = np.full((len(apps), n_days), np.nan)
+        ecpm[app_idx, date_idx] = ecpms
+        return cls(apps, start, income, ecpm)
+
+    @classmethod
+    def from_rows(cls, rows, start=None, end=None):
+        """从IncomeRow或带date/app_name/income/ecpm的字典建矩阵"""
+        app_names, dates, incomes, ecpms = [], [], [], []
+        for row in rows:
+            if not isinstance(row, dict):
+                row = row._asdict()
+            app_names.append(row["app_name"])
+            dates.append(row["date"])
+            incomes.append(float(row["income"] or 0))
+            ecpms.append(None if row.get("ecpm") in (None, "") else float(row["ecpm"]))
+        return cls.from_columns(app_names, dates, incomes, ecpms, start, end)
+
+    @classmethod
+    def from_store(cls, start, end, conn=None):
+        """从本地收入库读取[start, end]"""
+        from oppo_income_store import app_daily
+        rows = app_daily(start, end, conn)
+        app_names, dates, incomes, ecpms = zip(*rows) if rows else ([], [], [], [])
+        return cls.from_columns(app_names, dates, incomes, ecpms, start, end)
+
+
+def rolling_mean(values, window):
+    """沿日期方向的滚动均值，只算有数据的天；开头不足window天时按已有的天数算，窗口里没有数据时为NaN"""
+    valid = ~np.isnan(values)
+    pad = np.zeros((values.shape[0], 1))
+    sums = np.concatenate([pad, np.cumsum(np.where(valid, values, 0.0), axis=1)], axis=1)
+    counts = np.concatenate([pad, np.cumsum(valid, axis=1)], axis=1)
+
+    idx = np.arange(values.shape[1]) + 1
+    lo = np.maximum(0, idx - window)
+    window_sums = sums[:, idx] - sums[:, lo]
+    window_counts = counts[:, idx] - counts[:, lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+
+def day_over_day(values):
+    """环比：和前一天的差值和变化比例，第一天以及前一天没有数据或为0时比例是NaN"""
+    delta = np.full(values.shape, np.nan)
+    delta[:, 1:] = values[:, 1:] - values[:, :-1]
+    previous = np.full(values.shape, np.nan)
+    previous[:, 1:] = values[:, :-1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where(previous != 0, delta / previous, np.nan)
+    return delta, ratio
+
+
+def ecpm_drops(ecpm, baseline_days=ECPM_BASELINE_DAYS, drop_ratio=ECPM_DROP_RATIO, min_baseline=ECPM_MIN_BASELINE):
+    """ecpm下跌：当天ecpm比之前baseline_days天（不含当天）的均值低drop_ratio以上；返回(是否下跌, 均值)"""
+    baseline = np.full(ecpm.shape, np.nan)
+    baseline[:, 1:] = rolling_mean(ecpm, baseline_days)[:, :-1]
+    with np.errstate(invalid="ignore"):
+        drops = (ecpm < baseline * (1 - drop_ratio)) & (baseline >= min_baseline)
+    return drops, baseline
+
+
+def analyze(frame):
+    """计算全部指标，返回{名称: apps × dates数组}"""
+    result = {f"rolling_{window}": rolling_mean(frame.income, window) for window in ROLLING_WINDOWS}
+    result["dod"], result["dod_ratio"] = day_over_day(frame.income)
+    result["ecpm_drop"], result["ecpm_baseline"] = ecpm_drops(frame.ecpm)
+    return result
+
+
+def _fmt(value, pattern="{:,.2f}"):
+    return "-" if value is None or np.isnan(value) else pattern.format(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="oppo收入分析（读取本地收入库）")
+    parser.add_argument("--days", type=int, default=60, help="分析最近多少天，默认60")
+    parser.add_argument("--app", action="append", help="只看这个应用，可以写多次")
+    parser.add_argument("--drops", action="store_true", help="列出期间所有ecpm下跌")
+    args = parser.parse_args()
+
+    end = datetime.now().date() - timedelta(days=1)
+    start = end - timedelta(days=args.days - 1)
+    frame = IncomeFrame.from_store(start, end)
+    if not len(frame.apps):
+        print("[red]本地库里没有数据，先运行 python oppo_income_store.py sync")
+        return
+    result = analyze(frame)
+
+    rows = {i for i, app in enumerate(frame.apps) if not args.app or app in args.app}
+    print(f"[bold]{end} 各应用收入（{start} ~ {end}）")
+    for i in sorted(rows):
+        line = (f"{frame.apps[i]}: 收入={_fmt(frame.income[i, -1])}, 环比={_fmt(result['dod_ratio'][i, -1], '{:+.1%}')}, "
+                f"7天均值={_fmt(result['rolling_7'][i, -1])}, 30天均值={_fmt(result['rolling_30'][i, -1])}, "
+                f"ecpm={_fmt(frame.ecpm[i, -1])}")
+        print(f"[red bold]{line}（ecpm下跌）[/]" if result["ecpm_drop"][i, -1] else line)
+
+    if args.drops:
+        print(f"[bold]\necpm下跌（比之前{ECPM_BASELINE_DAYS}天均值低{ECPM_DROP_RATIO:.0%}以上）：")
+        dates = frame.dates
+        for i, d in zip(*np.nonzero(result["ecpm_drop"])):
+            if i in rows:
+                print(f"{dates[d]} {frame.apps[i]}: ecpm={_fmt(frame.ecpm[i, d])}, 之前均值={_fmt(result['ecpm_baseline'][i, d])}")
+
+
+if __name__ == "__main__":
+    main()
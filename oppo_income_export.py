@@ -0,0 +1,171 @@
+# 把收入报表逐行导出成CSV/JSONL/Parquet：每个公司按APP_QUERY_MAX_DAYS分段请求，一段处理完就写出，内存里最多只有几段的数据
+# 用法：python oppo_income_export.py --start 2024-01-01 --end 2024-03-31 --out income.csv [--company 主体名称] [--format parquet]
+# Parquet需要安装pyarrow
+
+import argparse
+import contextlib
+import csv
+import json
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from rich import print
+
+from oppo_incomes_query import OppoAdAPI, company_apps, date_chunks, keep_row, INCOME_WORKERS
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+PARQUET_BATCH_ROWS = 10000 #Parquet每攒够这么多行写一个batch
+
+IncomeRow = namedtuple("IncomeRow", ["date", "company", "app_id", "app_name", "bidding_type", "income", "ecpm"])
+
+
+def _float(value):
+    return None if value in (None, "") else float(value)
+
+
+def to_row(item, company):
+    """把接口返回的报表行转成IncomeRow，数值统一成float/int"""
+    bidding_type = item.get('biddingType')
+    return IncomeRow(
+        date=item['_date'],
+        company=company,
+        app_id=None if item.get('appId') is None else str(item['appId']),
+        app_name=item.get('appName'),
+        bidding_type=None if bidding_type is None else int(bidding_type),
+        income=_float(item.get('income')) or 0.0,
+        ecpm=_float(item.get('ecpm')),
+    )
+
+
+def iter_income_rows(start, end, companies=None, workers=INCOME_WORKERS, failures=None):
+    """按公司、日期分段逐行生成[start, end]的IncomeRow，筛选规则和收入查询一样
+
+    最多同时有workers个分段在请求，结果按公司、日期顺序生成；companies是要导出的公司名，None表示全部。
+    查询失败的分段打印出来跳过，同时记到failures列表里
+    """
+    unique_company_apps, app_names = company_apps()
+    targets = [
+        app_info for app_info in unique_company_apps.values()
+        if companies is None or app_info['COMPANY'] in companies
+    ]
+
+    def fetch(app_info, chunk_start, chunk_end):
+        api = OppoAdAPI(app_info["CLIENT_ID"], app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+        return api.app_query_range(chunk_start, chunk_end) #每段不超过APP_QUERY_MAX_DAYS天，只发一次请求
+
+    jobs = ((app_info, chunk) for app_info in targets for chunk in date_chunks(start, end))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        window = deque()
+        while True:
+            # 保持最多workers个分段在请求中，先提交的先消费
+            for app_info, (chunk_start, chunk_end) in jobs:
+                window.append((app_info, chunk_start, chunk_end, pool.submit(fetch, app_info, chunk_start, chunk_end)))
+                if len(window) >= workers:
+                    break
+            if not window:
+                return
+
+            app_info, chunk_start, chunk_end, future = window.popleft()
+            try:
+                json_data = future.result()
+                rows = json_data.get('data')
+                if rows is None:
+                    raise Exception(json_data.get('message'))
+            except Exception as e:
+                print(f"[red]{app_info['COMPANY']} {chunk_start}~{chunk_end} 查询失败: {e}", file=sys.stderr)
+                if failures is not None:
+                    failures.append((app_info['COMPANY'], chunk_start, chunk_end))
+                continue
+
+            for item in rows:
+                if keep_row(item, app_names):
+                    yield to_row(item, app_info['COMPANY'])
+
+
+def write_csv(rows, f):
+    writer = csv.writer(f)
+    writer.writerow(IncomeRow._fields)
+    count = 0
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+        count += 1
+    return count
+
+
+def write_jsonl(rows, f):
+    count = 0
+    for row in rows:
+        f.write(json.dumps(row._asdict(), ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def write_parquet(rows, path, batch_rows=PARQUET_BATCH_ROWS):
+    """分批写Parquet，内存里最多batch_rows行"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("导出Parquet需要安装pyarrow：pip install pyarrow")
+
+    schema = pa.schema([
+        ("date", pa.string()), ("company", pa.string()), ("app_id", pa.string()), ("app_name", pa.string()),
+        ("bidding_type", pa.int32()), ("income", pa.float64()), ("ecpm", pa.float64()),
+    ])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                writer.write_batch(pa.RecordBatch.from_arrays(list(zip(*batch)), schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_arrays(list(zip(*batch)), schema=schema))
+            count += len(batch)
+    return count
+
+
+def export(rows, path, fmt=None):
+    """把rows写到path，格式按fmt或扩展名决定，path为-时写到标准输出（仅csv/jsonl）；返回写出的行数"""
+    fmt = fmt or path.rsplit(".", 1)[-1].lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式：{fmt}，可选{', '.join(EXPORT_FORMATS)}")
+    if fmt == "parquet":
+        return write_parquet(rows, path)
+
+    writer = write_csv if fmt == "csv" else write_jsonl
+    if path == "-":
+        # 数据写到标准输出，查询过程中其他地方的提示都改到标准错误，不混进数据里
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            return writer(rows, out)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        return writer(rows, f)
+
+
+def main(argv=None):
+    yesterday = datetime.now().date() - timedelta(days=1)
+    parser = argparse.ArgumentParser(description="导出oppo联盟收入报表")
+    parser.add_argument("--start", type=lambda s: datetime.strptime(s, "%Y-%m-%d").date(), default=yesterday, help="开始日期YYYY-MM-DD，默认昨天")
+    parser.add_argument("--end", type=lambda s: datetime.strptime(s, "%Y-%m-%d").date(), default=yesterday, help="结束日期YYYY-MM-DD，默认昨天")
+    parser.add_argument("--out", required=True, help="输出文件，扩展名决定格式；-表示输出到屏幕（需要--format）")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="导出格式，不填按扩展名")
+    parser.add_argument("--company", action="append", help="只导出这个公司，可以写多次")
+    parser.add_argument("--workers", type=int, default=INCOME_WORKERS, help="同时请求的分段数")
+    args = parser.parse_args(argv)
+
+    failures = []
+    rows = iter_income_rows(args.start, args.end, args.company, args.workers, failures)
+    count = export(rows, args.out, args.format)
+    print(f"已导出{count}行到{args.out}", file=sys.stderr)
+    if failures:
+        print(f"[red]有{len(failures)}个分段查询失败，导出的数据不完整", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
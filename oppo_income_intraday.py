@@ -0,0 +1,127 @@
+# 当天收入的准实时跟踪：按小时粒度查询今天的报表，每次每个公司只发一个请求，只合并还没结束的小时
+# 最近INTRADAY_REVISION_HOURS个小时的数据平台还会修正，每次都重新合并；更早的小时不再变化，直接跳过
+# 合并时用新值替换旧值，汇总不会重复计算；一天的最后一次查询会重新合并全天
+# 用法：python oppo_income_intraday.py [--interval 300] [--top 10]
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from rich import print
+
+from oppo_client import start_token_refresher
+from oppo_incomes_query import OppoAdAPI, company_apps, keep_row, progress_bar, INCOME_WORKERS
+
+INTRADAY_INTERVAL = 300 #两次查询之间的秒数
+INTRADAY_REVISION_HOURS = 3 #最近几个小时（含正在进行的小时）每次都重新合并
+
+
+def row_hour(item):
+    """取报表行所属的小时（0-23），没有小时信息时返回None"""
+    value = item.get('hour')
+    if value not in (None, ""):
+        return int(value)
+    for key in ('time', 'statTime', 'date'):
+        value = str(item.get(key) or '').replace('-', '').replace(' ', '').replace(':', '')
+        if len(value) >= 10 and value[:10].isdigit(): #YYYYMMDDHH
+            return int(value[8:10])
+    return None
+
+
+class IntradayTracker:
+    """当天每个应用、每个公司的收入，内存里只存(应用, 小时)的收入"""
+
+    def __init__(self, day=None):
+        self.day = day or datetime.now().date()
+        self.cells = {} #公司 -> {(应用名, 小时): 收入}
+        self.closed_hour = {} #公司 -> 不再修正的最大小时，这之前的小时不再合并
+        self.app_totals = {}
+        self.company_totals = {}
+
+    def merge(self, company, rows, app_names, final=False):
+        """合并一个公司的按小时报表，返回这次合并带来的收入变化；final为True时重新合并全天"""
+        cells = self.cells.setdefault(company, {})
+        closed = -1 if final else self.closed_hour.get(company, -1)
+        latest = closed
+        delta = 0.0
+        for item in rows:
+            if not keep_row(item, app_names):
+                continue
+            hour = row_hour(item)
+            if hour is None or hour <= closed: #不再修正的小时已经合并过
+                continue
+            latest = max(latest, hour)
+            app_name = item.get('appName')
+            value = float(item.get('income') or 0)
+            change = value - cells.get((app_name, hour), 0.0)
+            cells[(app_name, hour)] = value
+            self.app_totals[app_name] = self.app_totals.get(app_name, 0.0) + change
+            delta += change
+        self.company_totals[company] = self.company_totals.get(company, 0.0) + delta
+        # 返回的最新一个小时还在进行，再往前INTRADAY_REVISION_HOURS-1个小时可能还会修正
+        self.closed_hour[company] = max(self.closed_hour.get(company, -1), latest - INTRADAY_REVISION_HOURS)
+        return delta
+
+    @property
+    def total(self):
+        return sum(self.company_totals.values())
+
+
+def poll_intraday(tracker, workers=INCOME_WORKERS, final=False):
+    """每个公司发一个按小时的请求并合并到tracker，返回{公司: 收入变化}；失败的公司不影响其他公司
+
+    final为True时是这一天的最后一次查询，重新合并全天的每个小时
+    """
+    unique_company_apps, app_names = company_apps()
+    companies = list(unique_company_apps.values())
+    deltas = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(companies)))) as pool:
+        futures = {}
+        for app_info in companies:
+            api = OppoAdAPI(app_info["CLIENT_ID"], app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+            futures[pool.submit(api.app_query_hourly, tracker.day)] = app_info
+
+        for future in as_completed(futures):
+            app_info = futures[future]
+            try:
+                json_data = future.result()
+                rows = json_data.get('data')
+                if rows is None:
+                    raise Exception(json_data.get('message'))
+            except Exception as e:
+                print(f"[red]{app_info['COMPANY']} 查询失败: {e}")
+                continue
+            deltas[app_info['COMPANY']] = tracker.merge(app_info['COMPANY'], rows, app_names, final)
+    return deltas
+
+
+def print_intraday(tracker, deltas, top=10):
+    print(f"[bold]{datetime.now():%Y-%m-%d %H:%M:%S} 今日收入：{tracker.total:,.2f}")
+    for company, total in sorted(tracker.company_totals.items(), key=lambda kv: -kv[1]):
+        print(f"  {company}: {total:,.2f}（本次+{deltas.get(company, 0):,.2f}）")
+    for app_name, total in sorted(tracker.app_totals.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"    {app_name}: {total:,.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按小时跟踪今天的收入")
+    parser.add_argument("--interval", type=float, default=INTRADAY_INTERVAL, help="两次查询之间的秒数")
+    parser.add_argument("--top", type=int, default=10, help="显示收入最高的几个应用")
+    args = parser.parse_args(argv)
+
+    start_token_refresher() #后台提前续期token，长时间运行时请求不用等token
+
+    tracker = IntradayTracker()
+    while True:
+        if datetime.now().date() != tracker.day: #过了零点，最后再查一次前一天的全天，然后开始统计新的一天
+            poll_intraday(tracker, final=True)
+            print(f"[bold]{tracker.day} 全天收入：{tracker.total:,.2f}")
+            tracker = IntradayTracker()
+        deltas = poll_intraday(tracker)
+        print_intraday(tracker, deltas, args.top)
+        progress_bar(args.interval)
+        print()
+
+
+if __name__ == "__main__":
+    main()
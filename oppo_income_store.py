@@ -0,0 +1,240 @@
+# 收入报表的本地SQLite仓库：已经结束的日期不会再变，只需要同步缺少的和还没出数的日期
+# 用法：python oppo_income_store.py sync --days 30
+#       python oppo_income_store.py report --start 2024-01-01 --end 2024-01-31 [--by-app]
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from rich import print
+
+from oppo_incomes_query import OppoAdAPI, company_apps, INCOME_WORKERS
+
+# 数据库的位置，可以用环境变量OPPO_INCOME_DB改到别处
+INCOME_DB_PATH = os.environ.get(
+    "OPPO_INCOME_DB",
+    os.path.join(os.path.expanduser("~"), ".oppo_ad", "income.db")
+)
+
+# biddingType为空（不区分bidding和标准）时存成0，避免主键里出现NULL
+NO_BIDDING_TYPE = 0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS income (
+    company      TEXT    NOT NULL,
+    app_name     TEXT    NOT NULL,
+    date         TEXT    NOT NULL,
+    bidding_type INTEGER NOT NULL,
+    income       REAL    NOT NULL,
+    ecpm         REAL,
+    raw          TEXT,
+    PRIMARY KEY (company, app_name, date, bidding_type)
+);
+CREATE INDEX IF NOT EXISTS idx_income_date ON income (date, app_name);
+CREATE TABLE IF NOT EXISTS synced_days (
+    company   TEXT    NOT NULL,
+    date      TEXT    NOT NULL,
+    closed    INTEGER NOT NULL,
+    synced_at REAL    NOT NULL,
+    PRIMARY KEY (company, date)
+);
+"""
+
+
+def connect(path=None):
+    """打开数据库，第一次使用时建表"""
+    path = path or INCOME_DB_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _dates(start, end):
+    return [start + timedelta(days=d) for d in range((end - start).days + 1)]
+
+
+def _runs(days):
+    """把有序的日期列表合并成连续区间，每个区间发一次范围查询"""
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def days_to_sync(conn, company, start, end):
+    """返回需要同步的日期：没同步过的，或者同步时还没出数的"""
+    closed = {
+        row[0] for row in conn.execute(
+            "SELECT date FROM synced_days WHERE company = ? AND closed = 1 AND date BETWEEN ? AND ?",
+            (company, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+        )
+    }
+    return [day for day in _dates(start, end) if day.strftime('%Y-%m-%d') not in closed]
+
+
+def _is_closed(day, total_income):
+    """前天及更早的数据视为已结算；昨天要等收入出来后才算结算；今天一直是未结算"""
+    yesterday = datetime.now().date() - timedelta(days=1)
+    if day < yesterday:
+        return True
+    return day == yesterday and total_income > 0
+
+
+def _fetch_company(app_info, runs):
+    """拉取一个公司若干个连续区间的报表行，失败时抛出异常"""
+    api = OppoAdAPI(app_info["CLIENT_ID"], app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+    rows = []
+    for run_start, run_end in runs:
+        json_data = api.app_query_range(run_start, run_end)
+        if json_data.get('data') is None:
+            raise Exception(json_data.get('message'))
+        rows.extend(json_data['data'])
+    return rows
+
+
+def _store_company(conn, company, days, rows):
+    """写入一个公司的报表行，并记录这些日期的同步状态；没有拿到任何行的日期不算结算，下次同步再查"""
+    totals = {}
+    records = []
+    for item in rows:
+        day_date = item.pop('_date', None)
+        if day_date is None: #app_query_range已经保证每行都有日期，这里只是防御
+            print(f"{company} 有报表行没有日期，已跳过")
+            continue
+        bidding_type = item.get('biddingType')
+        income = float(item.get('income') or 0)
+        totals[day_date] = totals.get(day_date, 0) + income
+        records.append((
+            company, item.get('appName'), day_date,
+            NO_BIDDING_TYPE if bidding_type is None else bidding_type,
+            income, item.get('ecpm'), json.dumps(item, ensure_ascii=False)
+        ))
+
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO income (company, app_name, date, bidding_type, income, ecpm, raw) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", records
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO synced_days (company, date, closed, synced_at) VALUES (?, ?, ?, ?)",
+            [
+                (company, day.strftime('%Y-%m-%d'),
+                 int(day.strftime('%Y-%m-%d') in totals and _is_closed(day, totals[day.strftime('%Y-%m-%d')])), now)
+                for day in days
+            ]
+        )
+    return len(records)
+
+
+def sync(start, end, conn=None, workers=INCOME_WORKERS):
+    """同步[start, end]内各公司缺少或未结算的日期，返回{公司: 写入行数}，失败的公司不影响其他公司"""
+    conn = conn or connect()
+    unique_company_apps, _ = company_apps()
+
+    plans = {}
+    for app_info in unique_company_apps.values():
+        days = days_to_sync(conn, app_info['COMPANY'], start, end)
+        if days:
+            plans[app_info['COMPANY']] = (app_info, days)
+
+    results = {}
+    if not plans:
+        return results
+
+    # 各公司并发拉取，写库统一在当前线程做
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(plans)))) as pool:
+        futures = {
+            pool.submit(_fetch_company, app_info, _runs(days)): company
+            for company, (app_info, days) in plans.items()
+        }
+        for future in as_completed(futures):
+            company = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(f"[red]{company} 同步失败: {e}")
+                continue
+            results[company] = _store_company(conn, company, plans[company][1], rows)
+    return results
+
+
+def report(start, end, conn=None, by_app=False):
+    """从本地库按日期汇总收入，筛选规则和income()一致；by_app为True时按(日期, 应用)汇总"""
+    conn = conn or connect()
+    _, app_names = company_apps()
+    if not app_names:
+        return []
+
+    placeholders = ",".join("?" * len(app_names))
+    group = "date, app_name" if by_app else "date"
+    sql = (
+        f"SELECT {group}, SUM(income) FROM income "
+        f"WHERE date BETWEEN ? AND ? AND bidding_type IN (2, ?) AND app_name IN ({placeholders}) "
+        f"GROUP BY {group} ORDER BY {group}"
+    )
+    params = [start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), NO_BIDDING_TYPE, *app_names]
+    return conn.execute(sql, params).fetchall()
+
+
+def app_daily(start, end, conn=None):
+    """从本地库取[start, end]每个应用每天的(应用名, 日期, 收入, ecpm)，筛选规则和report一致，按应用、日期排序"""
+    conn = conn or connect()
+    _, app_names = company_apps()
+    if not app_names:
+        return []
+
+    placeholders = ",".join("?" * len(app_names))
+    sql = (
+        f"SELECT app_name, date, SUM(income), MAX(ecpm) FROM income "
+        f"WHERE date BETWEEN ? AND ? AND bidding_type IN (2, ?) AND app_name IN ({placeholders}) "
+        f"GROUP BY app_name, date ORDER BY app_name, date"
+    )
+    params = [start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), NO_BIDDING_TYPE, *app_names]
+    return conn.execute(sql, params).fetchall()
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="oppo收入本地仓库")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_sync = sub.add_parser("sync", help="同步最近几天缺少或未结算的数据")
+    p_sync.add_argument("--days", type=int, default=30, help="同步最近多少天，默认30")
+
+    p_report = sub.add_parser("report", help="从本地库汇总收入")
+    p_report.add_argument("--start", type=_parse_date, required=True, help="开始日期 YYYY-MM-DD")
+    p_report.add_argument("--end", type=_parse_date, required=True, help="结束日期 YYYY-MM-DD")
+    p_report.add_argument("--by-app", action="store_true", help="按应用展开")
+
+    args = parser.parse_args()
+    conn = connect()
+
+    if args.command == "sync":
+        today = datetime.now().date()
+        begin = time.perf_counter()
+        results = sync(today - timedelta(days=args.days), today - timedelta(days=1), conn)
+        for company, count in results.items():
+            print(f"{company}: 写入{count}行")
+        print(f"同步完成，请求了{len(results)}个公司，耗时{time.perf_counter() - begin:.2f}秒")
+    else:
+        for row in report(args.start, args.end, conn, args.by_app):
+            if args.by_app:
+                print(f'{row[0]} {row[1]}: 收入={row[2]:,}')
+            else:
+                print(f'{row[0]} 总收入为：{row[1]:,}')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,22 @@
-import requests # type: ignore
 import json
 import time
-import hmac
-import hashlib
-import random
-from urllib.parse import urlencode
-import time
 from datetime import datetime, timedelta
 import random
 import sys
-from oppo_ad_config import APP_LIST #从外部文件读取应用列表信息
-
-API_DOMAIN = "https://openapi.heytapmobi.com"
-
-class OppoAdAPI:
-    def __init__(self, client_id, client_secret, media_id):
-        self.client_id = client_id
-        self.client_secret = client_secret
-        self.media_id = media_id
-        self.access_token = None
-        self.token_expire_time = 0
-
-    def _generate_signature(self, access_token, timestamp, nonce, params):
-        """签名生成算法"""
-        sorted_params = sorted((k, v) for k, v in params.items() if v is not None)
-        param_str = '&'.join(f"{k}={v}" for k, v in sorted_params)
-        base_str = f"access_token={access_token}&timestamp={timestamp}&nonce={nonce}"
-        if param_str:
-            base_str += f"&{param_str}"
-        signature = hmac.new(
-            self.client_secret.encode('utf-8'),
-            base_str.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        return signature
-
-    def get_access_token(self):
-        """获取access_token"""
-        if self.access_token and time.time() < self.token_expire_time:
-            return self.access_token
-
-        url = f"{API_DOMAIN}/oauth2/v1/token"
-        params = {
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "grant_type": "client_credentials"
-        }
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from oppo_app_registry import get_registry #应用列表从注册表读取，第一次用到时才加载
+from oppo_client import OppoAdAPI as BaseOppoAdAPI, start_token_refresher #公共的连接池、签名和请求
 
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("code") == 0:
-                self.access_token = result["data"]["access_token"]
-                self.token_expire_time = time.time() + result["data"]["expire_in"] - 300
-                return self.access_token
-            else:
-                raise Exception(f"获取token失败: {result.get('message')}")
-        except Exception as e:
-            print(f"获取access_token出错: {str(e)}")
-            return None
+INCOME_WORKERS = 8 #同时查询收入的公司数
+APP_QUERY_MAX_DAYS = 31 #平台单次报表查询的最长天数，范围更长时自动拆分
+POLL_MAX_ATTEMPTS = 100 #等待出数时最多查询的次数
+POLL_BASE_DELAY = 60 #第一次重试前等待的秒数，之后每次翻倍
+POLL_MAX_DELAY = 600 #重试等待的上限秒数
+POLL_ZERO_ATTEMPTS = 3 #其他公司出数后，收入还是0的公司再查这么多次仍为0就按0计算，不再等
 
-    def app_query(self,day):
+class OppoAdAPI(BaseOppoAdAPI):
 
-        if not self.get_access_token():
-            return {"code": -1, "message": "获取access_token失败"}
-
-        url = "https://openapi.heytapmobi.com/union/api/report/appQuery"
-        timestamp = str(int(time.time() * 1000))
-        nonce = str(random.randint(0, 20000))
+    def app_query(self,day):
 
         yesterday = datetime.now() - timedelta(days=day) #计算日期，1是昨天，2就是前天
 
@@ -79,73 +26,198 @@ class OppoAdAPI:
             "timeGranularity":"day"
         }
 
-        sign = self._generate_signature(
-            access_token=self.access_token,
-            timestamp=timestamp,
-            nonce=nonce,
-            params=params
-        )
-
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Authorization": f"{self.access_token}",
-            "X-Client-Send-Utc-Ms": timestamp,
-            "X-Nonce": nonce,
-            "X-Api-Sign": sign
+        return self._post("/union/api/report/appQuery", params), yesterday.strftime('%Y-%m-%d')
+
+    def app_query_range(self, start, end):
+        """按天粒度查询[start, end]的报表（date对象），超过APP_QUERY_MAX_DAYS自动拆分成多次请求
+
+        返回和接口一样的结构：成功时data是所有分段的数据合在一起，每行带上所属日期_date；任一分段失败时返回它的错误信息
+        """
+        rows = []
+        chunks = date_chunks(start, end)
+        while chunks:
+            chunk_start, chunk_end = chunks.pop(0)
+            params = {
+                "startTime": chunk_start.strftime('%Y%m%d'),
+                "endTime": chunk_end.strftime('%Y%m%d'),
+                "timeGranularity":"day"
+            }
+            json_data = self._post("/union/api/report/appQuery", params)
+            if json_data.get('data') is None:
+                return json_data
+            chunk_rows = json_data['data']
+            for item in chunk_rows:
+                item['_date'] = row_date(item, chunk_start if chunk_start == chunk_end else None)
+            if chunk_start != chunk_end and any(item['_date'] is None for item in chunk_rows):
+                #多天的返回里有认不出日期的行，不知道算哪天，改成逐天重新查询
+                print(f"{chunk_start}~{chunk_end} 的报表行没有可识别的日期，改为逐天查询")
+                chunks[:0] = date_chunks(chunk_start, chunk_end, 1)
+                continue
+            rows.extend(chunk_rows)
+        return {"code": 0, "data": rows}
+
+    def app_query_hourly(self, day):
+        """按小时粒度查询某一天（date对象）的报表，返回接口的json；当天查询时只有到目前为止的小时"""
+        params = {
+            "startTime": day.strftime('%Y%m%d'),
+            "endTime": day.strftime('%Y%m%d'),
+            "timeGranularity":"hour"
         }
+        return self._post("/union/api/report/appQuery", params)
 
-        sorted_params = sorted(params.items(), key=lambda x: x[0])
-        form_data = urlencode(sorted_params)
-
-        try:
-            response = requests.post(
-                url,
-                headers=headers,
-                data=form_data,
-                timeout=15
-            )
-            response.raise_for_status()
-            return response.json(), yesterday.strftime('%Y-%m-%d')
-        
-        except requests.exceptions.RequestException as e:
-            return {"code": -1, "message": str(e)}, yesterday.strftime('%Y-%m-%d')
-        
-def income(day):
-    all_income=0
-    unique_company_apps = {}
-    seen_companies = set()
-
-    # APP_LIST是以应用为维度维护的，在这里按公司去重
-    for app_id, app_info in APP_LIST.items():
-        company = app_info['COMPANY']
-        if company not in seen_companies:
-            unique_company_apps[app_id] = app_info
-            seen_companies.add(company)
-    # print(unique_company_apps)
-    
-    # 这里获取所有应用的名称
-    app_lsit = [app_info['APP_NAME'] for app_info in APP_LIST.values()]
-    # print(app_lsit)
-
-    for i in unique_company_apps:
-
-        # 先按每个公司来查询数据
-        app_info=unique_company_apps[i]
-        api = OppoAdAPI(app_info["CLIENT_ID"],app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
-        json_data,day_date = api.app_query(day)#调取查询接口，同时传入是查最近几天的
-        # print(json_data)
-
-        #从返回的信息中筛选出在APP_LIST中的应用的收入
-        for item in json_data['data']:
-            # print(item)
-            if item.get('biddingType') in [2, None]: #当有bidding和标准时只获取标准竞价的收入，当两种不分的时候就不算
-                if item.get('appName') in app_lsit:
-                    app_name = item.get('appName')
-                    income = item.get('income')
-                    all_income+=float(income)
-                    ecpm = item.get('ecpm')
-                    print(f'{app_name}: 收入={income:,}, ecpm={ecpm}')
-    return all_income, day_date
+def date_chunks(start, end, max_days=None):
+    """把[start, end]拆成每段不超过max_days天的区间"""
+    max_days = max_days or APP_QUERY_MAX_DAYS
+    chunks = []
+    while start <= end:
+        chunk_end = min(end, start + timedelta(days=max_days - 1))
+        chunks.append((start, chunk_end))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+def row_date(item, default=None):
+    """取报表行所属的日期，统一成YYYY-MM-DD；单天查询时行里没有日期字段就用查询的那天"""
+    for key in ('date', 'statDate', 'reportDate', 'time'):
+        value = item.get(key)
+        if value:
+            value = str(value).replace('-', '')[:8]
+            return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+    return default.strftime('%Y-%m-%d') if default else None
+
+def company_apps():
+    """应用列表是以应用为维度维护的，返回按公司去重后的应用和所有应用名称的集合（注册表加载时已经算好）"""
+    registry = get_registry()
+    return registry.company_apps(), registry.app_names
+
+def keep_row(item, app_names):
+    """收入报表行的筛选规则：应用在应用列表中，当有bidding和标准时只获取标准竞价的收入，当两种不分的时候就不算"""
+    return item.get('biddingType') in [2, None] and item.get('appName') in app_names
+
+def query_companies(companies, start, end, workers=INCOME_WORKERS, failures=None):
+    """并发查询多个公司[start, end]的报表，返回{公司: 筛选后的报表行}；失败的公司不在结果里，不影响其他公司
+
+    传入failures字典时，失败的公司和原因记到{公司: 错误信息}里；熔断中的公司不发请求，直接记为失败
+    """
+    _, app_names = company_apps()
+    results = {}
+    if not companies:
+        return results
+
+    # 各公司并发查询，哪个先返回就先合并哪个
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(companies)))) as pool:
+        futures = {}
+        for app_info in companies:
+            api = OppoAdAPI(app_info["CLIENT_ID"],app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+            futures[pool.submit(api.app_query_range, start, end)] = app_info
+
+        for future in as_completed(futures):
+            app_info = futures[future]
+            try:
+                json_data = future.result()
+                rows = json_data.get('data')
+                if rows is None: #请求失败时没有data，只跳过这个公司
+                    raise Exception(json_data.get('message'))
+            except Exception as e:
+                print(f"{app_info['COMPANY']} 查询失败: {e}")
+                if failures is not None:
+                    failures[app_info['COMPANY']] = str(e)
+                continue
+
+            #从返回的信息中筛选出在应用列表中的应用的收入
+            results[app_info['COMPANY']] = [item for item in rows if keep_row(item, app_names)]
+    return results
+
+def daily_totals(start, end, rows):
+    """按日期顺序逐天生成(日期, 总收入)，同时打印每个应用的收入"""
+    dates = [(start + timedelta(days=d)).strftime('%Y-%m-%d') for d in range((end - start).days + 1)]
+    by_date = {day_date: [] for day_date in dates}
+    for item in rows:
+        if item['_date'] in by_date:
+            by_date[item['_date']].append(item)
+
+    for day_date in dates:
+        all_income=0
+        for item in by_date[day_date]:
+            app_name = item.get('appName')
+            income = item.get('income')
+            all_income+=float(income)
+            ecpm = item.get('ecpm')
+            print(f'{app_name}: 收入={income:,}, ecpm={ecpm}')
+        yield day_date, all_income
+
+def income_range(start, end, workers=INCOME_WORKERS):
+    """每个公司只发一次范围查询，本地按日期拆分，按日期顺序逐天生成(日期, 总收入)，同时打印每个应用的收入"""
+    unique_company_apps, _ = company_apps()
+    results = query_companies(list(unique_company_apps.values()), start, end, workers)
+    rows = [item for company_rows in results.values() for item in company_rows]
+    yield from daily_totals(start, end, rows)
+
+def company_ready(rows, day_date):
+    """公司在day_date（YYYY-MM-DD）这天是否已经出数：筛选后的收入大于0"""
+    return sum(float(item.get('income') or 0) for item in rows if item['_date'] == day_date) > 0
+
+def settle_results(results, ready, zeros, day_date, zero_attempts=POLL_ZERO_ATTEMPTS):
+    """把一次查询的结果合并到ready{公司: 报表行}，返回这次确认的公司列表
+
+    收入大于0的公司直接确认；有公司已经出数后，收入为0的公司用zeros{公司: 次数}记连续为0的次数，
+    达到zero_attempts次就当作这天收入确实为0，不再等它
+    """
+    settled = []
+    for company, rows in results.items():
+        if company_ready(rows, day_date):
+            ready[company] = rows
+            zeros.pop(company, None)
+            settled.append(company)
+    if not ready: #还没有公司出数，收入为0只说明数据还没出来
+        return settled
+    for company, rows in results.items():
+        if company in ready:
+            continue
+        zeros[company] = zeros.get(company, 0) + 1
+        if zeros[company] >= zero_attempts:
+            print(f"{company} 在其他公司出数后连续{zero_attempts}次收入为0，按0计算")
+            ready[company] = rows
+            settled.append(company)
+    return settled
+
+def poll_until_ready(start, end, max_attempts=POLL_MAX_ATTEMPTS, base_delay=POLL_BASE_DELAY, max_delay=POLL_MAX_DELAY, failures=None):
+    """轮询直到每个公司end那天都出数，返回(已出数的{公司: 报表行}, 还没出数的公司列表)
+
+    已经出数的公司不再查询；剩下的公司按指数退避加随机抖动重试，全部出数就提前返回。
+    其他公司出数后，收入一直为0的公司查POLL_ZERO_ATTEMPTS次后按0计算，不会让整个报表一直等下去。
+    传入failures字典时，最后一次查询仍然失败的公司记到{公司: 错误信息}里（它们也在还没出数的列表中）
+    """
+    unique_company_apps, _ = company_apps()
+    pending = {app_info['COMPANY']: app_info for app_info in unique_company_apps.values()}
+    ready = {}
+    zeros = {}
+    end_date = end.strftime('%Y-%m-%d')
+    delay = base_delay
+
+    for attempt in range(max_attempts):
+        errors = {}
+        results = query_companies(list(pending.values()), start, end, failures=errors)
+        if failures is not None: #只保留最近一次的失败
+            failures.clear()
+            failures.update(errors)
+        for company in settle_results(results, ready, zeros, end_date):
+            del pending[company]
+
+        print(f"第{attempt + 1}次查询：{len(ready)}/{len(unique_company_apps)}个公司已出数")
+        if not pending or attempt == max_attempts - 1:
+            break
+
+        progress_bar(random.uniform(delay / 2, delay)) #加抖动，避免多个进程同时请求
+        print()
+        delay = min(max_delay, delay * 2)
+
+    return ready, list(pending)
+
+def income(day, workers=INCOME_WORKERS):
+    """查询某一天的收入，1是昨天，2就是前天；返回(总收入, 日期)"""
+    day_date = datetime.now().date() - timedelta(days=day)
+    for date_str, all_income in income_range(day_date, day_date, workers):
+        return all_income, date_str
 
 def progress_bar(duration, steps=60):
     #自定义样式的进度条
@@ -164,18 +236,25 @@ def progress_bar(duration, steps=60):
 
 def main():
 
+    start_token_refresher() #后台提前续期token，长时间运行时请求不用等token
+
     day=1 #获取最近几天的，1就是昨天，3就是之前3天的
 
-    for i in range(100): #尝试多次获取数据
+    today = datetime.now().date()
+    start, end = today - timedelta(days=day), today - timedelta(days=1)
 
-        for d in range(day):
-            incomes, day_date=income(day-d)
-            print(f'\n{day_date} 总收入为：{incomes:,}\n') 
+    # 每个公司出数后就不再查它，全部出数就结束
+    failures = {}
+    ready, pending = poll_until_ready(start, end, failures=failures)
+    not_ready = [company for company in pending if company not in failures]
+    if not_ready:
+        print(f"以下公司还没有出数：{', '.join(not_ready)}")
+    for company, message in failures.items():
+        print(f"{company} 查询失败，收入不在汇总里：{message}")
 
-        if int(incomes) > 0: #如果已经获取到收入则直接退出循环
-                break
-          
-        progress_bar(300) 
+    rows = [item for company_rows in ready.values() for item in company_rows]
+    for day_date, incomes in daily_totals(start, end, rows):
+        print(f'\n{day_date} 总收入为：{incomes:,}\n') 
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,198 @@
+# 媒体状态变化事件：把每次查到的状态和本地快照比较，只有状态真的变了才产生事件
+# 快照保存在磁盘上，重启后也能发现停机期间的变化；提醒（声音、桌面通知、文件、本地webhook）各自在后台线程里消费事件，
+# 播放声音之类的慢操作不会拖慢查询
+
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from rich import print
+
+# 快照位置，可以用环境变量OPPO_MEDIA_SNAPSHOT改到别处
+SNAPSHOT_PATH = os.environ.get(
+    "OPPO_MEDIA_SNAPSHOT",
+    os.path.join(os.path.expanduser("~"), ".oppo_ad", "media_status.json")
+)
+
+SINK_QUEUE_SIZE = 1000 #每个提醒的待处理事件上限，满了就丢弃，不阻塞查询
+
+MISSING = 0 #没找到应用时记录的状态
+
+
+def transition_kind(old, new):
+    """事件类型：frozen冻结、unfrozen解冻、missing找不到了、found重新找到、changed其他变化"""
+    if new == 4:
+        return "frozen"
+    if old == 4:
+        return "unfrozen"
+    if new == MISSING:
+        return "missing"
+    if old == MISSING:
+        return "found"
+    return "changed"
+
+
+class StatusSnapshot:
+    """每个应用最后一次看到的状态，按MEDIA_ID保存"""
+
+    def __init__(self, path=None):
+        self.path = path or SNAPSHOT_PATH
+        self.statuses = {} #MEDIA_ID -> {"status": unionStatus, "ts": 时间}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path=None):
+        snapshot = cls(path)
+        try:
+            with open(snapshot.path, "r", encoding="utf-8") as f:
+                snapshot.statuses = json.load(f)
+        except (OSError, ValueError):
+            pass
+        return snapshot
+
+    def save(self):
+        """先写临时文件再替换"""
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.statuses, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def update(self, media_id, status):
+        """记录一次状态，返回之前的状态；第一次见到的应用返回None"""
+        media_id = str(media_id)
+        previous = self.statuses.get(media_id)
+        if previous is None or previous["status"] != status:
+            self.statuses[media_id] = {"status": status, "ts": time.time()}
+            self.dirty = True
+        return None if previous is None else previous["status"]
+
+
+class SinkWorker(threading.Thread):
+    """在后台线程里把队列中的事件交给一个提醒处理"""
+
+    def __init__(self, sink):
+        super().__init__(name=f"oppo-alert-{type(sink).__name__}", daemon=True)
+        self.sink = sink
+        self.queue = queue.Queue(SINK_QUEUE_SIZE)
+        self.dropped = 0
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            try:
+                self.sink(event)
+            except Exception as e:
+                print(f"[red]{type(self.sink).__name__}提醒失败: {e}")
+
+    def stop(self, timeout=5):
+        """处理完已排队的事件后退出"""
+        self.queue.put(None)
+        self.join(timeout)
+
+
+class SoundSink:
+    """播放提醒声音"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def __call__(self, event):
+        from playsound import playsound #只有需要提醒时才导入
+        playsound(self.file_path)
+
+
+class DesktopSink:
+    """桌面通知：Linux用notify-send，macOS用osascript"""
+
+    def __call__(self, event):
+        title = "oppo媒体状态变化"
+        if sys.platform == "darwin":
+            command = ["osascript", "-e", f'display notification "{event["text"]}" with title "{title}"']
+        elif sys.platform.startswith("linux"):
+            command = ["notify-send", title, event["text"]]
+        else:
+            return
+        if shutil.which(command[0]) is None: #没有通知工具就不提醒
+            return
+        subprocess.run(command, timeout=10, check=False, capture_output=True)
+
+
+class FileSink:
+    """追加写入JSONL文件"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, event):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """把事件POST到本地的webhook地址"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, event):
+        import oppo_client
+        response = oppo_client.get_session(self.url).post(self.url, json=event, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class MediaEvents:
+    """状态变化事件流：observe()和快照比较，有变化时打印并分发给各个提醒；每轮查询结束调用commit()保存快照"""
+
+    def __init__(self, snapshot, sinks=(), status_text=str):
+        self.snapshot = snapshot
+        self.status_text = status_text
+        self.workers = [SinkWorker(sink) for sink in sinks]
+        for worker in self.workers:
+            worker.start()
+
+    def observe(self, app_info, status):
+        """记录一个应用这次查到的状态，返回产生的事件，没有变化返回None"""
+        old = self.snapshot.update(app_info["MEDIA_ID"], status)
+        if old is None or old == status:
+            return None
+        event = {
+            "kind": transition_kind(old, status),
+            "app": app_info["APP_NAME"],
+            "media_id": str(app_info["MEDIA_ID"]),
+            "company": app_info.get("COMPANY"),
+            "old": old,
+            "new": status,
+            "text": f"{app_info['APP_NAME']}: {self.status_text(old)} -> {self.status_text(status)}",
+            "ts": time.time(),
+        }
+        print(f"[yellow bold]【有新变化，请注意！】{event['text']}[/]")
+        for worker in self.workers:
+            worker.offer(event)
+        return event
+
+    def commit(self):
+        self.snapshot.save()
+
+    def close(self):
+        self.commit()
+        for worker in self.workers:
+            worker.stop()
@@ -0,0 +1,182 @@
+# 请求指标：每个接口的请求数、错误码、重试次数和各阶段耗时（限速等待、token、签名、HTTP往返、JSON解析）
+# 直方图用固定的桶，内存不随请求数增长；可以导出Prometheus文本或JSON快照，--profile时退出前打印按阶段的耗时分解
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+
+from rich import print
+
+# 直方图的桶上限（秒），最后一个是+Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+
+PHASES = ("rate_limit", "token", "sign", "http", "parse") #一次请求依次经过的阶段
+
+
+class Histogram:
+    """固定桶的耗时直方图，分位数在桶内线性插值"""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        target = p / 100 * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= target:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = min(BUCKETS[i], self.max)
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+        return self.max
+
+
+class Metrics:
+    """计数器和直方图，按(指标名, 标签)保存，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started = time.time()
+            self._started_perf = time.perf_counter()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """JSON可序列化的快照"""
+        with self._lock:
+            return {
+                "started": self.started,
+                "elapsed": time.perf_counter() - self._started_perf,
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name, "labels": dict(labels), "count": h.count, "sum": h.sum, "max": h.max,
+                        "p50": h.percentile(50), "p95": h.percentile(95), "p99": h.percentile(99),
+                    }
+                    for (name, labels), h in sorted(self.histograms.items())
+                ],
+            }
+
+    def prometheus(self):
+        """Prometheus文本格式"""
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {h.sum}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """按扩展名写出：.json写快照，其他写Prometheus文本；先写临时文件再替换"""
+        content = json.dumps(self.snapshot(), ensure_ascii=False, indent=2) if path.endswith(".json") else self.prometheus()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+METRICS = Metrics() #进程内共用的指标
+
+
+def profile_report(metrics=METRICS):
+    """按接口打印请求数、延迟分位数、错误码、重试，以及各阶段耗时占比"""
+    snapshot = metrics.snapshot()
+    requests_by = {}
+    for item in snapshot["counters"]:
+        labels = item["labels"]
+        if item["name"] == "oppo_api_requests_total":
+            requests_by.setdefault(labels["endpoint"], {})[labels["code"]] = item["value"]
+
+    print(f"[bold]请求耗时分解（运行{snapshot['elapsed']:.2f}秒）")
+    phases = {}
+    for item in snapshot["histograms"]:
+        labels = item["labels"]
+        if item["name"] == "oppo_api_request_seconds":
+            codes = ", ".join(f"{code}×{count}" for code, count in sorted(requests_by.get(labels["endpoint"], {}).items()))
+            print(f"  {labels['endpoint']}: {item['count']}次, p50={item['p50'] * 1000:.1f}ms, "
+                  f"p95={item['p95'] * 1000:.1f}ms, p99={item['p99'] * 1000:.1f}ms, 返回码 {codes}")
+        elif item["name"] == "oppo_api_phase_seconds":
+            phases[labels["phase"]] = phases.get(labels["phase"], 0.0) + item["sum"]
+
+    retries = [item for item in snapshot["counters"] if item["name"] == "oppo_api_retries_total"]
+    for item in retries:
+        print(f"  {item['labels']['endpoint']} 重试{item['value']}次（{item['labels']['reason']}）")
+    errors = [item for item in snapshot["counters"] if item["name"] == "oppo_api_errors_total"]
+    for item in errors:
+        print(f"  [red]{item['labels']['endpoint']} {item['labels']['kind']}×{item['value']}")
+
+    total = sum(phases.values())
+    if total:
+        print("  各阶段累计耗时（多个线程的耗时相加）：")
+        for phase in PHASES:
+            if phase in phases:
+                print(f"    {phase}: {phases[phase]:.3f}秒（{phases[phase] / total:.1%}）")
+
+
+def enable_profile(profile=True, metrics_out=None):
+    """进程退出前打印耗时分解（profile）并把指标写到metrics_out"""
+    def finish():
+        if profile:
+            profile_report()
+        if metrics_out:
+            METRICS.write(metrics_out)
+    if profile or metrics_out:
+        atexit.register(finish)
@@ -0,0 +1,173 @@
+# 常驻调度器：一个进程里定时跑媒体状态查询、收入出数检查和token续期，代替三个各自sleep轮询的脚本
+# 所有任务共用oppo_client里的连接池和token缓存；每个任务有自己的间隔和随机抖动，上一次没跑完时跳过本次
+# 用法：python oppo_scheduler.py [--media-interval 30] [--income-interval 600] [--token-interval 60]
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from rich import print
+
+import oppo_client
+from oppo_metrics import METRICS, enable_profile
+
+
+class Job:
+    """一个定时任务：func在线程里执行，不会卡住事件循环"""
+
+    def __init__(self, name, func, interval, jitter=0, run_at_start=True):
+        self.name = name
+        self.func = func
+        self.interval = interval #两次执行之间的秒数
+        self.jitter = jitter #每次额外随机等待0~jitter秒，避免多个任务同时请求
+        self.run_at_start = run_at_start
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_duration = 0.0
+
+    def next_delay(self):
+        return self.interval + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+
+class Scheduler:
+    """asyncio调度器，等待用asyncio.sleep，不占CPU"""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self._tasks = set()
+
+    async def _run_once(self, job):
+        job.running = True
+        begin = time.perf_counter()
+        try:
+            await asyncio.to_thread(job.func)
+            job.runs += 1
+        except Exception as e:
+            job.failures += 1
+            print(f"[red]任务{job.name}出错: {e}")
+        finally:
+            job.last_duration = time.perf_counter() - begin
+            job.running = False
+
+    def _start(self, job):
+        """启动一次执行；上一次还没结束就跳过，防止同一个任务重叠"""
+        if job.running:
+            job.skipped += 1
+            print(f"[yellow]任务{job.name}上一次还没结束，跳过本次")
+            return
+        task = asyncio.create_task(self._run_once(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _loop(self, job):
+        if job.run_at_start:
+            self._start(job)
+        while True:
+            await asyncio.sleep(job.next_delay())
+            self._start(job)
+
+    async def run(self):
+        await asyncio.gather(*(self._loop(job) for job in self.jobs))
+
+
+def media_poller():
+    """媒体状态：每个应用按自己的自适应间隔查询，调度器只负责定时调用poll检查哪些应用到期"""
+    import oppo_ad_query
+
+    return oppo_ad_query.AdaptiveMediaPoller(events=oppo_ad_query.media_events())
+
+
+class IncomeReadinessJob:
+    """等昨天的收入出数：每次只查还没出数的公司，全部出数后打印汇总，当天不再请求"""
+
+    def __init__(self):
+        self.day = None
+        self.ready = {}
+        self.zeros = {} #公司 -> 其他公司出数后连续收入为0的次数
+        self.done = False
+
+    def __call__(self):
+        import oppo_incomes_query
+
+        day = datetime.now().date() - timedelta(days=1)
+        if day != self.day: #过了零点，开始等新的一天
+            self.day, self.ready, self.zeros, self.done = day, {}, {}, False
+        if self.done:
+            return
+
+        unique_company_apps, _ = oppo_incomes_query.company_apps()
+        pending = [app_info for app_info in unique_company_apps.values() if app_info['COMPANY'] not in self.ready]
+        day_date = day.strftime('%Y-%m-%d')
+        failures = {}
+        results = oppo_incomes_query.query_companies(pending, day, day, failures=failures)
+        oppo_incomes_query.settle_results(results, self.ready, self.zeros, day_date)
+        failed = f"，{len(failures)}个查询失败（{', '.join(failures)}）" if failures else ""
+        print(f"{day_date}：{len(self.ready)}/{len(unique_company_apps)}个公司已出数{failed}")
+
+        if len(self.ready) == len(unique_company_apps):
+            rows = [item for company_rows in self.ready.values() for item in company_rows]
+            for date_str, incomes in oppo_incomes_query.daily_totals(day, day, rows):
+                print(f'\n{date_str} 总收入为：{incomes:,}\n')
+            self.done = True
+
+
+class IntradayJob:
+    """按小时跟踪今天的收入，过了零点换成新的一天"""
+
+    def __init__(self):
+        self.tracker = None
+
+    def __call__(self):
+        import oppo_income_intraday as intraday
+
+        if self.tracker is not None and self.tracker.day != datetime.now().date(): #过了零点，最后再查一次前一天的全天
+            intraday.poll_intraday(self.tracker, final=True)
+            print(f"[bold]{self.tracker.day} 全天收入：{self.tracker.total:,.2f}")
+            self.tracker = None
+        if self.tracker is None:
+            self.tracker = intraday.IntradayTracker()
+        deltas = intraday.poll_intraday(self.tracker)
+        intraday.print_intraday(self.tracker, deltas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="oppo联盟常驻调度器")
+    parser.add_argument("--media-interval", type=float, default=30, help="检查媒体状态到期应用的间隔（秒），0表示不跑")
+    parser.add_argument("--income-interval", type=float, default=600, help="收入出数检查间隔（秒），0表示不跑")
+    parser.add_argument("--intraday-interval", type=float, default=0, help="按小时跟踪今天收入的间隔（秒），默认不跑")
+    parser.add_argument("--token-interval", type=float, default=60, help="token续期检查间隔（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="随机抖动占间隔的比例")
+    parser.add_argument("--profile", action="store_true", help="退出时打印请求各阶段的耗时分解")
+    parser.add_argument("--metrics-out", help="每分钟把请求指标写到这个文件，.json为快照，其他为Prometheus文本")
+    args = parser.parse_args()
+
+    enable_profile(args.profile, args.metrics_out)
+
+    jobs = [Job("token续期", oppo_client.refresh_due_tokens, args.token_interval, run_at_start=False)]
+    poller = None
+    if args.media_interval:
+        poller = media_poller()
+        jobs.append(Job("媒体状态", poller.poll, args.media_interval, args.media_interval * args.jitter))
+    if args.income_interval:
+        jobs.append(Job("收入出数", IncomeReadinessJob(), args.income_interval, args.income_interval * args.jitter))
+    if args.intraday_interval:
+        jobs.append(Job("今日收入", IntradayJob(), args.intraday_interval, args.intraday_interval * args.jitter))
+    if args.metrics_out:
+        jobs.append(Job("写出指标", lambda: METRICS.write(args.metrics_out), 60, run_at_start=False))
+
+    print(f"调度器已启动：{', '.join(f'{job.name}每{job.interval:g}秒' for job in jobs)}")
+    try:
+        asyncio.run(Scheduler(jobs).run())
+    except KeyboardInterrupt:
+        print("调度器已退出")
+    finally:
+        if poller is not None: #把排队的提醒处理完、保存快照
+            poller.events.close()
+
+
+if __name__ == "__main__":
+    main()
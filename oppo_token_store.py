@@ -0,0 +1,127 @@
+# access_token的本地磁盘缓存：按CLIENT_ID保存，多个脚本、多个进程共用，避免每次启动都重新请求token
+# 直接运行本文件可以并发预热应用列表里所有主体的token
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# token文件的位置，可以用环境变量OPPO_TOKEN_STORE改到别处
+TOKEN_STORE_PATH = os.environ.get(
+    "OPPO_TOKEN_STORE",
+    os.path.join(os.path.expanduser("~"), ".oppo_ad", "tokens.json")
+)
+
+
+@contextmanager
+def _locked(path):
+    """对path旁边的.lock文件加独占锁，同一时间只有一个进程读写token文件"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "a+") as lock_file:
+        if os.name == "nt":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _read(path):
+    """读取token文件，文件不存在或损坏时当作空的"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(path, tokens):
+    """先写临时文件再替换，避免写到一半被其他进程读到"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(tokens, f)
+    if os.name != "nt":
+        os.chmod(tmp_path, 0o600) #token相当于密钥，只允许自己读
+    os.replace(tmp_path, path)
+
+
+def load_token(client_id, path=None):
+    """读取还在有效期内的token，返回(access_token, 过期时间戳)，没有或已过期返回None"""
+    path = path or TOKEN_STORE_PATH
+    with _locked(path):
+        entry = _read(path).get(str(client_id))
+    if entry and time.time() < entry.get("expire_time", 0):
+        return entry["access_token"], entry["expire_time"]
+    return None
+
+
+def save_token(client_id, access_token, expire_time, path=None):
+    """保存token，expire_time是已经减去提前量的过期时间戳；顺便清掉已过期的记录"""
+    path = path or TOKEN_STORE_PATH
+    now = time.time()
+    with _locked(path):
+        tokens = {k: v for k, v in _read(path).items() if v.get("expire_time", 0) > now}
+        tokens[str(client_id)] = {"access_token": access_token, "expire_time": expire_time}
+        _write(path, tokens)
+
+
+def clear_token(client_id, path=None, access_token=None):
+    """删除某个主体的token，例如token被平台判定失效时；传入access_token时只在缓存的就是这个token时才删"""
+    path = path or TOKEN_STORE_PATH
+    with _locked(path):
+        tokens = _read(path)
+        entry = tokens.get(str(client_id))
+        if entry is not None and (access_token is None or entry.get("access_token") == access_token):
+            del tokens[str(client_id)]
+            _write(path, tokens)
+
+
+def warm_up(app_list=None, workers=8):
+    """并发获取应用列表里所有主体的token并写入缓存，返回{CLIENT_ID: 是否成功}"""
+    from oppo_client import OppoAdAPI
+    if app_list is None:
+        from oppo_app_registry import get_registry
+        app_list = get_registry().apps
+
+    # 同一个CLIENT_ID只需要取一次
+    credentials = {}
+    for app_info in app_list.values():
+        credentials.setdefault(app_info["CLIENT_ID"], app_info)
+
+    def fetch(app_info):
+        api = OppoAdAPI(app_info["CLIENT_ID"], app_info["CLIENT_SECRET"], app_info["MEDIA_ID"])
+        return api.get_access_token() is not None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(credentials)))) as pool:
+        results = pool.map(fetch, credentials.values())
+        return dict(zip(credentials, results))
+
+
+def main():
+    from rich import print
+
+    begin = time.perf_counter()
+    results = warm_up()
+    for client_id, ok in results.items():
+        print(f"{client_id}: {'[green]成功' if ok else '[red]失败'}")
+    print(f"预热{len(results)}个主体的token，耗时{time.perf_counter() - begin:.2f}秒，缓存文件：{TOKEN_STORE_PATH}")
+    if not all(results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()